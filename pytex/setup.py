@@ -1,6 +1,8 @@
 # -*- coding: utf8 -*-
 from distutils.core import setup
+from distutils.command.build_py import build_py
 import subprocess
+import sys
 import os
 
 #===============================================================================
@@ -10,6 +12,18 @@ local = subprocess.check_output('kpsewhich -var-value=TEXMFLOCAL', shell=True)
 local = local.decode('utf8').split(':')[0].strip()
 TEXMF_DIR = os.path.join(local, 'tex', 'latex', 'alttex')
 
+#===============================================================================
+# Build the package manifest used by the lazy package mode
+#===============================================================================
+class build_py_manifest(build_py):
+    def run(self):
+        build_py.run(self)
+        path = os.path.join(self.build_lib, 'pytex', 'lib', 'manifest.json')
+        env = dict(os.environ)
+        paths = [os.path.abspath(self.build_lib), env.get('PYTHONPATH')]
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, paths))
+        subprocess.check_call([sys.executable, '-m', 'pytex.package', path], env=env)
+
 #===============================================================================
 # Main setup routine
 #===============================================================================
@@ -47,6 +61,8 @@ Main features:
                 'pytex.lib', 'pytex.lib.packages', 'pytex.lib.latex', 'pytex.lib.tex',
                 'alttex', 'alttex.script', 'alttex.var_command',
                 'alttex.filters'],
+      package_data={'pytex.lib': ['manifest.json']},
+      cmdclass={'build_py': build_py_manifest},
       scripts=['data/alttex', 'data/aLaTeX'],
       data_files=[(TEXMF_DIR, ('data/alttex.sty',))],
       requires=[],
@@ -64,6 +64,7 @@ from pytex.job import TeXJob
 from pytex.util.mathfuncs import lcm
 from pytex.util.files import readfile
 from pytex.util.iterators import walk_items
+from pytex.textypes import freeze
 
 #===============================================================================
 # Main alternative sources processor
@@ -76,21 +77,53 @@ class AltSource:
     ==========
     
     source : str or file
-        A string holding the template source.
+        A string holding the template source or a file object. Files are 
+        processed in chunks and the ``.source`` attribute is None.
     filename : str
         An optional filename. If not given and source is a file, it is 
         automatically extracted from the ".name" attribute.
+    stream_cache : TokenStreamCache
+        An optional cache of token streams (see pytex.cache). Unchanged 
+        sources are not tokenized again.
+    parse_cache : ParseCache
+        An optional cache of parsed documents (see pytex.cache). The master
+        document of unchanged sources is not parsed again.
+    persistent : bool
+        If True, templates and documents are built as persistent trees (see
+        pytex.textypes.persistent) that share all elements that do not change
+        between versions. This saves memory when many versions are kept.
     '''
-    def __init__(self, source, filename=None):
-        self.source, self.filename = readfile(source, None)
+    def __init__(self, source, filename=None, stream_cache=None, parse_cache=None,
+                 persistent=False):
+        # Files are tokenized directly by TeXJob, without holding a copy of 
+        # their contents
+        if isinstance(source, str):
+            self.source, self.filename = readfile(source, None)
+        else:
+            self.source, self.filename = None, getattr(source, 'name', None)
         if filename is not None:
             self.filename = filename
 
-        self._master = TeXJob(self.source, packages=['alttex']).parse()
+        if parse_cache is None:
+            job = TeXJob(source, packages=['alttex'], stream_cache=stream_cache)
+            self._master = job.parse()
+        else:
+            if self.source is None:
+                source = source.read()
+                if isinstance(source, bytes):
+                    source = source.decode('utf8')
+            else:
+                source = self.source
+            self._master = parse_cache.get(source, ['alttex'])
+            if self._master is None:
+                job = TeXJob(source, packages=['alttex'], stream_cache=stream_cache)
+                self._master = job.parse()
+                parse_cache.put(source, self._master, ['alttex'])
         self._master = self._master.revalue('includes')
         self._cache_docs = {}
         self._cache_sources = {}
         self._parsed = {}
+        self._frozen = freeze(self._master) if persistent else None
 
         # Extract the set of alt_sections and alt_sizes parameters from all
         # elements in the master document
@@ -132,6 +165,8 @@ class AltSource:
 
         if idx is None:
             return self._master
+        elif self._frozen is not None:
+            return self._frozen_template(idx).thaw()
         else:
             try:
                 return self._parsed[idx]
@@ -140,6 +175,22 @@ class AltSource:
                 self._parsed[idx] = new
                 return new
 
+    def get_frozen(self, idx, section=None):
+        '''Return the idx-th version that belongs to the given section as a
+        frozen tree. Only available for persistent sources.'''
+
+        if self._frozen is None:
+            raise ValueError('AltSource was not created with persistent=True')
+        return self._frozen_template(idx).revalue('alttex', section, idx)
+
+    def _frozen_template(self, idx):
+        try:
+            return self._parsed[idx]
+        except KeyError:
+            new = self._frozen.revalue('template', idx)
+            self._parsed[idx] = new
+            return new
+
     def get_document(self, idx, section=None):
         '''Return a parsed TeX structure for the idx-th version that belongs
         to the given section'''
@@ -150,6 +201,8 @@ class AltSource:
             pass
 
         # Revalue the document with alttex specifc flags
+        if self._frozen is not None:
+            return self.get_frozen(idx, section).thaw()
         templ = self.get_template(idx)
         return templ.copy().revalue('alttex', section, idx)
 
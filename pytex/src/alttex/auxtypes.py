@@ -112,7 +112,7 @@ class Choices:
         '''Fill with alternatives up to the given size'''
         # TODO: implementação tosca
         import random, string, sympy
-        from pytex.alttex.script import oneof
+        from .script import oneof
         if isinstance(size, str):
             size = string.ascii_letters.find(size.lower())  # @UndefinedVariable
 
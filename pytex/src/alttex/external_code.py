@@ -6,9 +6,6 @@ from pytex.textypes import TeXString
 from pytex.util.errors import render_error
 from .namespace import Namespace
 from .auxtypes import Choices
-from . import script
-import pygments.lexers
-import pygments.formatters
 
 #===============================================================================
 # Namespace code handlers
@@ -133,6 +130,9 @@ class PyRunner(Runner):
         return eval(self.code_eval, self.namespace)
 
     def context_create(self):
+        # The script namespace loads sympy: import it only when code runs
+        from . import script
+
         ctx = {}
         for k, v in vars(script).items():
             if not k.startswith('_'):
@@ -142,6 +142,9 @@ class PyRunner(Runner):
     def format_error(self, error):
         '''Format some exception for displaying inside a document.'''
 
+        import pygments.lexers
+        import pygments.formatters
+
         pylex = pygments.lexers.get_lexer_by_name('python')
         texfmt = pygments.formatters.get_formatter_by_name('latex')
         texfmt.linenos = True
@@ -1,6 +1,6 @@
+import sys
 from pytex.util.texfy import TeXfy
-from pytex.alttex.filters import isfilter
-import sympy as sp
+from .core import isfilter
 
 #===============================================================================
 # Vector representations
@@ -11,7 +11,8 @@ def _comp_convert(x):
     elif x == -1:
         return '-'
     txt = TeXfy(x).source()
-    if isinstance(x, sp.Add):
+    sp = sys.modules.get('sympy')  # sympy objects exist only if it was imported
+    if sp is not None and isinstance(x, sp.Add):
         txt = '\\left(%s\right)' % txt
     return txt
 
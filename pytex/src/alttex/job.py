@@ -7,11 +7,14 @@ from .altsource import AltSource
 
 class Job:
     def __init__(self, file, filename=None):
-        self.children, self.filename = readfile(file, filename)
+        # Files without a name are named as anonymous TeX jobs
+        if isinstance(file, str):
+            file, self.filename = readfile(file, filename)
+        else:
+            self.filename = filename or getattr(file, 'name', None) or 'texput'
         if self.filename.endswith('.lyx'):
-            self.read_lyx()
-        self.altsource = AltSource(self.children, self.filename)
-        print(self.children)
+            file = self.read_lyx()
+        self.altsource = AltSource(file, self.filename)
 
         # Private attributes
         self._sections = list(self.altsource.get_section_names())
@@ -34,9 +37,12 @@ class Job:
         self._num_templates = value
 
     def read_lyx(self):
+        '''Export LyX file to LaTeX and return the contents of the .tex file'''
+
         self.system('lyx -e latex %s' % self.filename)
-        filename = self.filename[:-4] + '.tex'
-        self.children, self.filename = readfile(open(filename), filename)
+        self.filename = self.filename[:-4] + '.tex'
+        with open(self.filename) as F:
+            return F.read()
 
     #===========================================================================
     # Make final documents
@@ -318,6 +318,10 @@ class libinclude(Command):
 
         if context is None:
             context = self.context
+
+        # Included files are processed in a fork and cannot modify context
+        context = context.fork()
+
         def process(path):
             '''Process a TeX document file'''
 
@@ -805,8 +809,8 @@ class var(Command):
 #===============================================================================
 # Remove old imports from __all__
 __all__ = list(set(dir()) - set(__all__ + ['__all__']))
-from .. import Package, register_package
-PACKAGE = Package.from_module('pytex.alttex.latex_lib', 'alttex')
+from pytex import Package, register_package
+PACKAGE = Package.from_module(__name__, 'alttex')
 register_package('alttex', PACKAGE)
 
 # Fix local latex converters in the Choice and Choices classes
@@ -3,7 +3,7 @@ from . import tokens
 from .context import Context
 from .textypes import *
 from .package import *
-from .job import TeXJob, TeX
+from .job import TeXJob, TeX, TeX_many
 from .util import *
 
 #===============================================================================
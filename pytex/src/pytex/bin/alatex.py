@@ -1,28 +1,16 @@
 import sys
 import os
 from pytex.errors import LaTeXError
-from pytex import alttex
-from pytex.util.errors import render_error
+from pytex.bin import daemon
 
 def pre_process(texfile, altfile):
-    '''Process alttex file'''
+    '''Process alttex file. 
+    
+    The file is processed by the resident daemon (see pytex.bin.daemon) or
+    in-process if no daemon is running.'''
 
-    # Convert to latex if Lyx input
-    if texfile.endswith('.lyx'):
-        execute('lyx -e pdflatex %s' % texfile)
-        texfile = texfile[:-3] + 'tex'
-
-    # Process altsource for a single run
-    with open(texfile) as F:
-        try:
-            alt = alttex.AltSource(F)
-            out = alt.get_source(0)
-        except:
-            out = render_error(as_document=True)
-
-    # Save the processed file
-    with open(altfile, 'w') as F:
-        F.write(out)
+    daemon.run('preprocess', path=os.path.abspath(texfile),
+               output=os.path.abspath(altfile))
 
 def process_error(texfile):
     print('error on: ', texfile)
@@ -9,8 +9,9 @@ language (commands such as \VAR, \CMD, etc) that can be used used to mix LaTeX
 with some other data source.   
 '''
 
-from pytex.alttex.job import Job
+from pytex.bin import daemon
 import argparse
+import subprocess
 import os
 import sys
 
@@ -51,17 +52,23 @@ def main(cmd=None):
     if args.debug:
         sys.excepthook = info
 
-    job = Job(open(args.file))
-    if args.sections:
-        job.set_sections(args.sections.split(','))
-    if args.output:
-        job.set_output(args.output)
-    job.set_numdocs(args.num_templates)
+    kwds = dict(path=os.path.abspath(args.file),
+                sections=args.sections.split(',') if args.sections else None,
+                output=os.path.abspath(args.output) if args.output else None,
+                num_templates=args.num_templates)
 
-    if args.tex:
-        job.make_tex()
+    # LaTeX files are created by the resident daemon, if it is running. Debug
+    # mode always runs in-process
+    if args.debug:
+        texfiles = daemon.make_tex(**kwds)
     else:
-        job.make_pdf()
+        texfiles = daemon.run('make_tex', **kwds)
+
+    if not args.tex:
+        for f in texfiles:
+            cmd = ['pdflatex', '-interaction=nonstopmode', f]
+            print(' '.join(cmd))
+            subprocess.run(cmd)
 
 if __name__ == '__main__':
     os.chdir('../../examples')
@@ -0,0 +1,377 @@
+r'''
+Resident alttex daemon
+======================
+
+Editors call ``aLaTeX`` and ``alttex`` on every preview, and each call pays
+for Python start-up, module imports and context construction. The daemon keeps
+a pool of warm worker processes with the alttex package loaded and listens for
+requests on a local UNIX socket. Start it with
+
+    $ python -m pytex.bin.daemon [--socket PATH] [--workers N]
+
+and stop it with ``--stop``. The entry points use run(), which sends the
+request to the daemon and falls back to in-process execution when no daemon is
+running.
+
+Requests and responses are single lines of JSON. A request names a command
+and its keyword arguments::
+
+    {"command": "preprocess", "path": "/abs/doc.tex", "output": "/abs/doc-alt.tex",
+     "section": null, "version": 0}
+
+The response is ``{"status": "ok", "result": ...}`` or
+``{"status": "error", "type": "...", "error": "..."}``. Errors of builtin types
+are raised again in the client with their original type, which is also a
+subclass of DaemonError.
+
+The socket is created in ``$XDG_RUNTIME_DIR`` or, if it is not set, in a
+directory that only the user can access. Clients refuse to talk to sockets
+owned by other users.
+
+>>> import threading
+>>> tmpdir = tempfile.mkdtemp()
+>>> path = os.path.join(tmpdir, 'daemon.sock')
+>>> server = Server(path, workers=1)
+>>> thread = threading.Thread(target=server.serve_forever)
+>>> thread.start()
+>>> request('ping', path) != os.getpid()
+True
+
+Render the second version of a document
+
+>>> src, out = os.path.join(tmpdir, 'doc.tex'), os.path.join(tmpdir, 'doc-alt.tex')
+>>> with open(src, 'w') as F:
+...     F.write(r'\alt{a|b|c}')
+11
+>>> request('preprocess', path, path=src, output=out, version=1) == out
+True
+>>> open(out).read()
+'b'
+
+Errors are raised again in the client
+
+>>> try:
+...     request('preprocess', path, path=src + '.missing', output=out)
+... except FileNotFoundError as ex:
+...     print(type(ex).__name__, isinstance(ex, DaemonError))
+FileNotFoundError True
+>>> request('shutdown', path)
+>>> thread.join(); server.server_close()
+>>> is_running(path)
+False
+'''
+
+import os
+import sys
+import json
+import stat
+import struct
+import socket
+import builtins
+import tempfile
+import argparse
+import subprocess
+import socketserver
+
+def _default_socket():
+    '''Return the default socket path: $XDG_RUNTIME_DIR/pytex.sock or a path
+    in a per-user directory in $TMPDIR'''
+
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'pytex.sock')
+    return os.path.join(tempfile.gettempdir(), 'pytex-%s' % os.getuid(), 'daemon.sock')
+
+SOCKET_PATH = os.environ.get('PYTEX_SOCKET') or _default_socket()
+
+# Parsed documents are cached in this directory if the environment variable
+# is set. Cached documents are pickles: the directory must not be writable by
+# other users (see pytex.cache.ParseCache)
+CACHE_DIR = os.environ.get('PYTEX_CACHE_DIR')
+
+class DaemonError(Exception):
+    '''Error raised by a command executed in the daemon'''
+
+_ERROR_TYPES = {}
+
+def _error_type(name):
+    '''Return the exception type used to raise an error of the given type
+    in the client.
+
+    Builtin exceptions are raised as a subclass of both the original type
+    and DaemonError, so callers can handle them as usual but still tell them
+    apart from errors of the connection to the daemon.'''
+
+    try:
+        return _ERROR_TYPES[name]
+    except KeyError:
+        base = getattr(builtins, name, None)
+        if isinstance(base, type) and issubclass(base, Exception):
+            new = type(name, (DaemonError, base), {'__module__': __name__})
+        else:
+            new = DaemonError
+        return _ERROR_TYPES.setdefault(name, new)
+
+#===============================================================================
+# Commands
+#===============================================================================
+_PARSE_CACHE = None
+_IN_WORKER = False
+
+def _parse_cache():
+    '''Return the parse cache of this process or None.
+
+    Daemon workers always keep a cache in memory, so unchanged documents are
+    not parsed again between previews. Other processes only use the on-disk
+    cache in CACHE_DIR, if it is set.'''
+
+    global _PARSE_CACHE
+
+    if _PARSE_CACHE is None and (_IN_WORKER or CACHE_DIR is not None):
+        from pytex.cache import ParseCache
+        _PARSE_CACHE = ParseCache(CACHE_DIR)
+    return _PARSE_CACHE
+
+def ping():
+    '''Return the pid of the process that executes the command'''
+
+    return os.getpid()
+
+def preprocess(path, output, section=None, version=0):
+    '''Render a single version of an alttex document and save it to output.
+
+    LyX files are exported to LaTeX first. Errors are rendered as a LaTeX
+    document.'''
+
+    import alttex
+    from pytex.util.errors import render_error
+
+    # Convert to latex if Lyx input
+    if path.endswith('.lyx'):
+        subprocess.run(['lyx', '-e', 'pdflatex', path])
+        path = path[:-3] + 'tex'
+
+    # Process altsource for a single run
+    with open(path) as F:
+        try:
+            alt = alttex.AltSource(F, parse_cache=_parse_cache())
+            out = alt.get_source(version, section)
+        except:
+            out = render_error(as_document=True)
+
+    # Save the processed file
+    with open(output, 'w') as F:
+        F.write(out)
+    return output
+
+def make_tex(path, sections=None, output=None, num_templates=1):
+    '''Create the LaTeX files for all versions of the given sections of an
+    alttex document. Return the list of created files.'''
+
+    from alttex.job import Job
+
+    with open(path) as F:
+        job = Job(F)
+    if sections:
+        job.set_sections(sections)
+    if output:
+        job.set_output(output)
+    job.set_numdocs(num_templates)
+    job.make_tex()
+    return sorted(job._texfiles)
+
+COMMANDS = {
+    'ping': ping,
+    'preprocess': preprocess,
+    'make_tex': make_tex,
+}
+
+#===============================================================================
+# Server
+#===============================================================================
+def _init_worker(packages):
+    '''Load packages and build their base macro table in a new worker'''
+
+    global _IN_WORKER
+
+    from pytex import Context
+
+    _IN_WORKER = True
+
+    if 'alttex' in packages:
+        import alttex  # @UnusedImport
+    Context(packages)
+
+def _execute(command, kwds):
+    return COMMANDS[command](**kwds)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''Read a request, execute it in the worker pool and write the response'''
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf8'))
+            command = request.pop('command')
+            if command == 'shutdown':
+                self.server.shutdown()
+                result = None
+            elif command not in COMMANDS:
+                raise ValueError('invalid command: %r' % command)
+            else:
+                result = self.server.pool.submit(_execute, command, request).result()
+            response = {'status': 'ok', 'result': result}
+        except Exception as ex:
+            response = {'status': 'error', 'type': type(ex).__name__, 'error': str(ex)}
+        self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''A server that executes requests in a pool of warm worker processes.
+
+    Each connection is handled by a thread that waits for a worker, so
+    concurrent requests run in parallel, up to the number of workers. The
+    constructor waits for a worker to load the packages and raises
+    BrokenProcessPool if it fails.'''
+
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, workers=None, packages=['alttex']):
+        from concurrent.futures import ProcessPoolExecutor
+
+        _make_socket_dir(path)
+
+        # Remove sockets left by dead daemons
+        if os.path.exists(path):
+            if is_running(path):
+                raise RuntimeError('daemon already running on %s' % path)
+            os.remove(path)
+
+        super().__init__(path, RequestHandler)
+        os.chmod(path, 0o600)
+        self.path = path
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                        initargs=(list(packages),))
+
+        # Workers that cannot load the packages break the pool for good: check
+        # it now instead of failing on every request. The error is printed by
+        # the worker.
+        try:
+            self.pool.submit(ping).result()
+        except Exception:
+            self.server_close()
+            raise
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _make_socket_dir(path):
+    '''Create the directory of the socket path, if necessary, and check that
+    other users cannot replace the socket'''
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, 0o700, exist_ok=True)
+    st = os.stat(dirname)
+    writable = st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    if st.st_uid not in (os.getuid(), 0) or (writable and not st.st_mode & stat.S_ISVTX):
+        raise PermissionError('insecure socket directory: %s' % dirname)
+
+def serve(path=SOCKET_PATH, workers=None, packages=['alttex']):
+    '''Run the daemon until a shutdown request is received'''
+
+    server = Server(path, workers, packages)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+#===============================================================================
+# Client
+#===============================================================================
+def request(command, socket_path=SOCKET_PATH, timeout=None, **kwds):
+    '''Execute command in the daemon listening on the given socket path and
+    return its result.
+
+    Raises an OSError (usually FileNotFoundError or ConnectionRefusedError) if
+    no daemon is running, PermissionError if the socket belongs to another
+    user and DaemonError if the command fails.'''
+
+    data = dict(kwds, command=command)
+    _check_owner(os.stat(socket_path).st_uid, socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        if hasattr(socket, 'SO_PEERCRED'):
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                    struct.calcsize('3i'))
+            _check_owner(struct.unpack('3i', creds)[1], socket_path)
+        sock.sendall(json.dumps(data).encode('utf8') + b'\n')
+        with sock.makefile('rb') as F:
+            line = F.readline()
+    if not line:
+        raise DaemonError('connection closed by the daemon')
+
+    response = json.loads(line.decode('utf8'))
+    if response['status'] != 'ok':
+        raise _error_type(response.get('type'))(response['error'])
+    return response['result']
+
+def _check_owner(uid, path):
+    if uid != os.getuid():
+        raise PermissionError('daemon socket %s belongs to another user' % path)
+
+def is_running(path=SOCKET_PATH):
+    '''Return True if a daemon is listening on the given socket path'''
+
+    try:
+        request('ping', path, timeout=5)
+    except (OSError, DaemonError):
+        return False
+    return True
+
+def run(command, socket_path=SOCKET_PATH, **kwds):
+    '''Execute command in the daemon or in the current process if no daemon
+    is running or if the daemon fails.
+
+    Errors of builtin types raised by the command are raised again. Other
+    errors, such as a broken worker pool or a lost connection, are not
+    errors of the command: it is executed again in the current process.'''
+
+    try:
+        return request(command, socket_path, **kwds)
+    except DaemonError as ex:
+        if type(ex) is not DaemonError:
+            raise
+    except (FileNotFoundError, ConnectionError):
+        pass
+    return COMMANDS[command](**kwds)
+
+#===============================================================================
+# Take action
+#===============================================================================
+def parser():
+    'Creates a parser for the program arguments'
+
+    parser = argparse.ArgumentParser(description='Resident alttex server')
+    parser.add_argument('-s', '--socket', default=SOCKET_PATH, help='path of the UNIX socket')
+    parser.add_argument('-w', '--workers', type=int, help='number of worker processes')
+    parser.add_argument('--stop', action='store_true', help='stop the running daemon')
+    return parser
+
+def main(cmd=None):
+    'Executes the main command'
+
+    args = parser().parse_args(cmd)
+    if args.stop:
+        try:
+            request('shutdown', args.socket)
+        except DaemonError as ex:
+            print('error stopping the daemon: %s' % ex, file=sys.stderr)
+        except OSError:
+            print('no daemon running on %s' % args.socket, file=sys.stderr)
+    else:
+        serve(args.socket, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+'''Persistent caches that avoid repeating work on unchanged sources.'''
+
+if __name__ == '__main__':
+    import pytex; __package__ = 'pytex'  # @ReservedAssignment @UnusedImport
+
+import os
+import hashlib
+import pickle
+import tempfile
+from collections import OrderedDict
+from . import tokens as TK
+from .job import TeXJob
+from . import package as package_module
+from .package import load_packages
+
+__all__ = ['DiskCache', 'TokenStreamCache', 'ParseCache']
+
+#===============================================================================
+# Files on disk
+#===============================================================================
+class DiskCache:
+    '''A directory of binary files named by their keys. 
+    
+    The cache is limited to `maxsize` bytes. When it grows larger, the least 
+    recently used files are removed until the size drops below a fraction
+    `LOW_WATER` of the limit. The size of the cache is measured once and then
+    updated on each write, so the directory is only scanned again when the 
+    limit is exceeded. Files written by other processes are counted at the 
+    next scan.
+    
+    Example
+    -------
+    
+    >>> import tempfile
+    >>> cache = DiskCache(tempfile.mkdtemp(), maxsize=5)
+    >>> cache.write('a', b'foo'); cache.read('a')
+    b'foo'
+    >>> cache.write('b', b'bar'); cache.read('a') is None
+    True
+    '''
+
+    SUFFIX = '.bin'
+    LOW_WATER = 0.9
+
+    def __init__(self, directory, maxsize=256 * 2 ** 20):
+        os.makedirs(directory, 0o700, exist_ok=True)
+        self.directory = directory
+        self.maxsize = maxsize
+        self._size = None
+
+    def __len__(self):
+        return len(self._files())
+
+    def read(self, key):
+        '''Return the data stored with the given key or None'''
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as F:
+                data = F.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def write(self, key, data):
+        '''Store data with the given key. Files are replaced atomically.'''
+
+        path = self._path(key)
+        if self._size is None:
+            self._size = self._scan()[0]
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as F:
+                F.write(data)
+            self._size += len(data) - self._filesize(path)
+            os.replace(tmp_path, path)
+        except:
+            self._remove(tmp_path)
+            raise
+        if self._size > self.maxsize:
+            self.evict()
+
+    def remove(self, key):
+        '''Remove the given key from cache, if it exists'''
+
+        path = self._path(key)
+        if self._size is not None:
+            self._size -= self._filesize(path)
+        self._remove(path)
+
+    def evict(self):
+        '''Remove the least recently used files until the total size of the
+        cache is at most LOW_WATER * maxsize'''
+
+        total, files = self._scan()
+        files.sort()
+        for _, size, path in files:
+            if total <= self.LOW_WATER * self.maxsize:
+                break
+            self._remove(path)
+            total -= size
+        self._size = total
+
+    def clear(self):
+        '''Remove all files from cache'''
+
+        for path in self._files():
+            self._remove(path)
+        self._size = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _files(self):
+        return [os.path.join(self.directory, f)
+                for f in os.listdir(self.directory) if f.endswith(self.SUFFIX)]
+
+    def _scan(self):
+        '''Return the total size and a list of (mtime, size, path) tuples for 
+        all files in cache'''
+
+        files = []
+        for path in self._files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return sum(size for _, size, _ in files), files
+
+    def _filesize(self, path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+#===============================================================================
+# Token streams
+#===============================================================================
+class TokenStreamCache(DiskCache):
+    r'''An on-disk cache of token streams.
+
+    Streams are content addressed: files are named after a hash of the source
+    text and of the catcode table used to tokenize it. Hence an unchanged
+    source is never scanned twice, even across different processes.
+
+    Example
+    -------
+
+    >>> import tempfile
+    >>> cache = TokenStreamCache(tempfile.mkdtemp())
+    >>> tokens = cache.tokenizer(r'\foo bar')   # miss: source is scanned
+    >>> tokens = cache.tokenizer(r'\foo bar')   # hit: stream is loaded
+    >>> list(tokens)
+    ['\\foo'(0), ' '(16), 'b'(11), 'a'(11), 'r'(11)]
+    >>> len(cache)
+    1
+    '''
+
+    SUFFIX = '.tok'
+
+    def key(self, source, catcodes=None):
+        '''Return the hash string that identifies the token stream of source'''
+
+        if catcodes is None:
+            catcodes = TK.DEFAULT_CATCODE_TABLE
+        elif not isinstance(catcodes, TK.CatcodeTable):
+            catcodes = TK.CatcodeTable(catcodes)
+        header = '%s:%r:%s\n' % (TK.TokenStream.VERSION,
+                                 catcodes.categories(), catcodes.default)
+        digest = hashlib.sha1(header.encode('utf8'))
+        digest.update(source.encode('utf8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def load(self, source, catcodes=None):
+        '''Return the cached TokenStream for source or None if it is not in
+        the cache'''
+
+        key = self.key(source, catcodes)
+        data = self.read(key)
+        if data is None:
+            return None
+        try:
+            return TK.TokenStream.from_bytes(data)
+        except ValueError:
+            self.remove(key)
+            return None
+
+    def save(self, source, stream, catcodes=None):
+        '''Store the token stream of source in the cache'''
+
+        self.write(self.key(source, catcodes), stream.to_bytes())
+
+    def tokenizer(self, source, catcodes=None):
+        '''Return a Tokenizer for source that replays the cached token stream.
+
+        The stream is recorded and saved if it is not in the cache.'''
+
+        stream = self.load(source, catcodes)
+        if stream is None:
+            stream = TK.TokenStream.record(source, catcodes)
+            self.save(source, stream, catcodes)
+        tokens = TK.Tokenizer(source, catcodes)
+        tokens.replay(stream)
+        return tokens
+
+#===============================================================================
+# Parsed documents
+#===============================================================================
+class ParseCache:
+    r'''A cache of parsed documents.
+
+    Documents are keyed by a hash of the source and of the loaded packages 
+    (the names and argspecs of all their macros). They are kept in memory in
+    an LRU cache with at most `maxitems` documents and, if a directory is
+    given, in a DiskCache limited to `maxsize` bytes.
+    
+    Documents are stored pickled and each hit unpickles a new copy. Returned
+    documents can thus be freely modified.
+    
+    Unpickling data can execute arbitrary code. Anyone who can write to the 
+    cache directory can thus run code in the processes that read from it. The
+    directory is created readable and writable only by its owner, and it must
+    never be shared with other users (e.g., do not point PYTEX_CACHE_DIR to a
+    world writable location such as /tmp).
+
+    Example
+    -------
+
+    >>> cache = ParseCache()
+    >>> doc = cache.parse(r'\hello world!')
+    >>> doc2 = cache.parse(r'\hello world!')
+    >>> doc2, doc2 is doc
+    (TeXStream([<\hello macro>, 'world!']), False)
+    >>> cache.stats()
+    {'hits': 1, 'misses': 1, 'memory_hits': 1, 'disk_hits': 0, 'hit_ratio': 0.5}
+    
+    Entries that cannot be unpickled are dropped and count as misses
+    
+    >>> cache._memory[cache.key(r'\hello world!')] = b'corrupted'
+    >>> print(cache.get(r'\hello world!'))
+    None
+    >>> cache.stats()['hits'], cache.stats()['misses']
+    (1, 2)
+    '''
+
+    VERSION = 1
+
+    def __init__(self, directory=None, maxitems=128, maxsize=256 * 2 ** 20):
+        self.maxitems = maxitems
+        self._memory = OrderedDict()
+        if directory is None:
+            self._disk = None
+        else:
+            self._disk = _DocumentFiles(directory, maxsize)
+        self.reset_stats()
+
+    def key(self, source, packages=()):
+        '''Return the hash string that identifies the document parsed from
+        source with the given packages'''
+
+        digest = self._package_digest(packages).copy()
+        if package_module.MANIFEST is not None:
+            lazy = sorted(package_module.MANIFEST['packages'].items())
+            digest.update(('lazy:%r\n' % lazy).encode('utf8'))
+        digest.update(source.encode('utf8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _package_digest(self, packages):
+        '''Return a hash object updated with the names and argspecs of all 
+        macros in the given packages. Hashes are computed once for each set of
+        packages and package revisions.'''
+
+        packages = load_packages(packages, load_latex=True)
+        key = (self.VERSION,) + tuple((id(p), p.revision) for p in packages)
+        try:
+            return _PACKAGE_DIGESTS[key][1]
+        except KeyError:
+            pass
+
+        digest = hashlib.sha1(('%s\n' % self.VERSION).encode('utf8'))
+        for package in packages:
+            digest.update(('%s\n' % package.name).encode('utf8'))
+            for name in sorted(package):
+                argspec = getattr(package[name], 'argspec', None)
+                declaration = getattr(argspec, '_declaration', '')
+                digest.update(('%s:%s\n' % (name, declaration)).encode('utf8'))
+
+        # Packages are saved with the digest so their ids are not reused
+        _PACKAGE_DIGESTS[key] = (packages, digest)
+        return digest
+
+    def get(self, source, packages=()):
+        '''Return a copy of the cached document or None'''
+
+        key = self.key(source, packages)
+        memory = self._memory
+        data = memory.get(key)
+        if data is not None:
+            memory.move_to_end(key)
+            hit = 'memory_hits'
+        elif self._disk is not None:
+            data = self._disk.read(key)
+            if data is not None:
+                self._store(key, data)
+                hit = 'disk_hits'
+        if data is None:
+            self._stats['misses'] += 1
+            return None
+
+        # Entries that cannot be loaded are dropped and count as misses
+        try:
+            document = pickle.loads(data)
+        except Exception:
+            memory.pop(key, None)
+            if self._disk is not None:
+                self._disk.remove(key)
+            self._stats['misses'] += 1
+            return None
+        self._stats[hit] += 1
+        return document
+
+    def put(self, source, document, packages=()):
+        '''Store a parsed document'''
+
+        key = self.key(source, packages)
+        data = pickle.dumps(document, pickle.HIGHEST_PROTOCOL)
+        self._store(key, data)
+        if self._disk is not None:
+            self._disk.write(key, data)
+
+    def parse(self, source, packages=[]):
+        '''Return the parsed document for source, parsing it only if it is not
+        in the cache'''
+
+        doc = self.get(source, packages)
+        if doc is None:
+            doc = TeXJob(source, packages=packages).parse()
+            self.put(source, doc, packages)
+        return doc
+
+    def clear(self):
+        '''Remove all documents from cache'''
+
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def _store(self, key, data):
+        memory = self._memory
+        memory[key] = data
+        memory.move_to_end(key)
+        while len(memory) > self.maxitems:
+            memory.popitem(last=False)
+
+    #===========================================================================
+    # Instrumentation
+    #===========================================================================
+    def stats(self):
+        '''Return a dictionary with the number of hits, misses, hits in 
+        each cache level and the hit ratio'''
+
+        stats = dict(self._stats)
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+        return {k: stats[k] for k in ['hits', 'misses', 'memory_hits', 
+                                      'disk_hits', 'hit_ratio']}
+
+    def reset_stats(self):
+        '''Reset all counters'''
+
+        self._stats = {'misses': 0, 'memory_hits': 0, 'disk_hits': 0}
+
+_PACKAGE_DIGESTS = {}
+
+class _DocumentFiles(DiskCache):
+    '''The on-disk storage of ParseCache'''
+
+    SUFFIX = '.doc'
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
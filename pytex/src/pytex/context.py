@@ -2,24 +2,43 @@ if __name__ == '__main__':
     import pytex; __package__ = 'pytex.elements'  # @UnusedImport @ReservedAssignment
 
 import warnings
+from types import MappingProxyType
 from contextlib import contextmanager
 from .types.nested_dict import NestedDict
 
 class Context:
     '''Defines a TeX processor state. It maps names to macros and environments, 
-    it store global variables for the TeX processor, current environment, etc.'''
+    it store global variables for the TeX processor, current environment, etc.
+    
+    The macro table obtained from loading the TeX, LaTeX and the given packages
+    is computed only once and saved as a frozen table in BASE_TABLES. New 
+    contexts start with a copy of this table.'''
     PACKAGE = None
+    BASE_TABLES = {}
 
     def __init__(self, packages=[], macros={}):
         self._init_class()
-        self._macro_table = NestedDict()
-        self._packages = [[]]
         self._namespace = {}
+        self._shared = False
 
         # Load TeX and LaTeX macros
         packages = self.PACKAGE.load_packages(packages, load_latex=True)
-        for package in packages:
-            self.load_package(package)
+        key = (type(self),) + tuple((id(p), p.revision) for p in packages)
+        try:
+            _, table, names = self.BASE_TABLES[key]
+        except KeyError:
+            self._macro_table = NestedDict()
+            self._packages = [[]]
+            for package in packages:
+                self.load_package(package)
+
+            # Packages are saved with the table so their ids are not reused
+            table = MappingProxyType(dict(self._macro_table))
+            names = tuple(self._packages[0])
+            self.BASE_TABLES[key] = (packages, table, names)
+        else:
+            self._macro_table = NestedDict(table)
+            self._packages = [list(names)]
 
     def get_macro(self, macro_name, warn=2):
         '''Return the macro if it exists in the macro table'''
@@ -27,6 +46,12 @@ class Context:
         try:
             return self._macro_table[macro_name]
         except KeyError:
+            # In lazy mode, load the package that defines the macro
+            package = self.PACKAGE.find_package(macro_name)
+            if package is not None and not self.has_package(package):
+                self.load_package(package)
+                return self.get_macro(macro_name, warn)
+
             if warn >= 2:
                 raise ValueError('macro not found: %s' % macro_name)
             elif warn == 1:
@@ -77,11 +102,20 @@ class Context:
                 elif issubclass(obj, self._ENVIRONMENT):
                     self.save_environment(obj)
 
+        if self._shared:
+            self._unshare()
         self._packages[-1].append(package.name)
 
+    def has_package(self, name):
+        '''Return True if the package with the given name was loaded'''
+
+        return any(name in names for names in self._packages)
+
     def set_variable(self, varname, value):
         '''Set the value of a context variable'''
 
+        if self._shared:
+            self._unshare()
         self._namespace[varname] = value
 
     def get_variable(self, varname, *args):
@@ -124,9 +158,43 @@ class Context:
             from pytex import package
             cls.PACKAGE = package
 
+    def fork(self):
+        '''Return a new context with the same macros, packages and variables.
+        
+        Forks share all data. The macro table of each context only records 
+        the macros that it defines after the fork, and the variables and the
+        list of packages are copied when they are modified for the first 
+        time. Changes in one context are never seen by the other.
+        
+        Example
+        -------
+        
+        >>> ctx = Context(); fork = ctx.fork()
+        >>> fork.set_variable('foo', 1)
+        >>> fork.get_variable('foo'), ctx.get_variable('foo', None)
+        (1, None)
+        '''
+
+        new = object.__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new._macro_table = self._macro_table.fork()
+        new._shared = self._shared = True
+        return new
+
+    def _unshare(self):
+        self._namespace = dict(self._namespace)
+        self._packages = [list(names) for names in self._packages]
+        self._shared = False
+
     def copy(self):
-        warnings(NotImplemented)
-        return self
+        '''Alias to fork()'''
+
+        return self.fork()
+
+    def __deepcopy__(self, memo):
+        # Copies of documents (e.g., document versions) share their context
+        # copy-on-write
+        return self.fork()
 
 if __name__ == '__main__':
     import doctest
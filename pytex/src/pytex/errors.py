@@ -16,20 +16,21 @@ class MissingTokenError(LaTeXSyntaxError):
         self.tokenizer = tokenizer
 
         # Get line number and character number to be reported
-        lineno = tokenizer.get_lineno()
-        charno = tokenizer.get_charno()
+        lineno, charno = tokenizer.position()
 
         # Create user message
-        self.msg = msg = ['error around line %s, char %s' % (lineno, charno),
+        self.msg = msg = ['error around line %s, char %s' % (lineno + 1, charno + 1),
             'I was expecting %s, but got %s' % (self.report_expected(), self.report_tok()),
             '-' * 80]
 
-        print(repr(tokenizer.source))
-        print('*' * 80)
-        print(self.tokenizer.source[:tokenizer._pos])
-        print(list(range(max(0, lineno - 3), lineno + 1)), lineno)
-        lines = [ tokenizer.get_line(i) for i in range(max(0, lineno - 3), lineno + 1) ]
-        lines.append(' ' * max(0, charno - 1) + '^^^')  # highlight error
+        # File sources may have discarded the first lines
+        lines = []
+        for i in range(max(0, lineno - 3), lineno + 1):
+            try:
+                lines.append(tokenizer.get_line(i))
+            except ValueError:
+                pass
+        lines.append(' ' * charno + '^^^')  # highlight error
         if len(lines) > 2:
             lines.insert(0, '...')
         self.msg.extend(lines)
@@ -25,15 +25,18 @@ which is presented to the user.
 if __name__ == '__main__':
     import pytex; __package__ = 'pytex'  # @ReservedAssignment @UnusedImport
 
+import os
+
 # Import tokens and catcodes
 from . import tokens as TK
 from .errors import LaTeXError
+from .types.abc import RFile
 from .textypes import (TeXDocument, TeXStream, TeXToken, Text, Group, TeXElement)
 from .textypes.texmath import Math, DisplayMath
 from .textypes.macro import Macro
-from .textypes.environment import Environment
+from .textypes.environment import Environment, BeginEnv
 
-__all__ = ['TeXJob', 'TeX']
+__all__ = ['TeXJob', 'TeX', 'TeX_many']
 
 NoneType = type(None)
 
@@ -54,6 +57,13 @@ class TeXJob:
     >>> p.parse()
     TeXStream([<\hello macro>, 'world!'])
     
+    Files (or mmaps) are tokenized in chunks, without reading the whole file 
+    into memory
+    
+    >>> import io
+    >>> TeXJob(io.StringIO(r'\hello world!')).parse()
+    TeXStream([<\hello macro>, 'world!'])
+    
     TeXJob understands most LaTeX commands and can correctly assign arguments to
     each macro
         
@@ -96,21 +106,41 @@ class TeXJob:
     Some \TeX document.
     \end{document}
     
+    A TokenStreamCache (see pytex.cache) can be given in order to reuse the 
+    tokens of sources that were already processed. Files are read at once in
+    this case, since the cache is keyed by the complete source text.
+    
+    >>> import tempfile
+    >>> from pytex.cache import TokenStreamCache
+    >>> cache = TokenStreamCache(tempfile.mkdtemp())
+    >>> TeXJob(r'\hello world!', stream_cache=cache).parse()
+    TeXStream([<\hello macro>, 'world!'])
+    
     
     '''
-    def __init__(self, source, packages=[], silent=True):
-        if not isinstance(source, str):
-            raise TypeError('source must be a string')
-        elif not source:
-            raise ValueError('empty source string')
-
-        self.source = str(source)
-        self._tokens = TK.Tokenizer(source)
+    def __init__(self, source, packages=[], silent=True, stream_cache=None):
+        if isinstance(source, str):
+            if not source:
+                raise ValueError('empty source string')
+            source = str(source)
+        elif not isinstance(source, RFile):
+            raise TypeError('source must be a string or a file')
+
+        self.source = source
+        if stream_cache is None:
+            self._tokens = TK.Tokenizer(source)
+        else:
+            if not isinstance(source, str):
+                source = source.read()
+                if isinstance(source, bytes):
+                    source = source.decode('utf8')
+            self._tokens = stream_cache.tokenizer(source)
         self._buffer = []
         self._master = TeXStream()
         self._env_table = {}
         self._is_parsed = False
         self._silent = silent
+        self._readers = {}
 
         for p in packages:
             self.context.load_package(p)
@@ -169,57 +199,28 @@ class TeXJob:
         Any number of tokens (starting from 1) can be consumed by this function.
         Tokens are consumed until a consistent element can be created.'''
 
-        token = tokens.tell_next()
-        tk = TK
-
-        # Old versions of this code were pushing initialized TeXElements to the
-        # tokenizer. This cannot happen anymore!
-        assert isinstance(token, (tk.Token, NoneType)), 'invalid type for token: %s' % type(token).__name__
+        readers = self._readers
 
         try:
-            # Macros
-            if isinstance(token, tk.TkEscape):
-                macro = self.read_macro(tokens)
-                if macro is None:
-                    return self.read_next(tokens)
-                else:
-                    return macro
-
-            # The tokenizer returns None from tell_next() when we run out of
-            # tokens. We should return these None's to sinalize the parser
-            # that there are nothing more to process
-            elif token is None:
-                return None
-
-            # Text tokens
-            elif 10 <= token.catcode <= 12:
-                return self.read_text(tokens)
-
-            # Groups
-            elif isinstance(token, tk.TkBGroup):
-                return self.read_group(tokens)
-
-            # Math
-            elif isinstance(token, tk.TkMath):
-                return self.read_math(tokens)
-
-            # TkSkipped text can be either a skipped whitespace or a skipped new line
-            # we are ignoring skipped spaces but trying to keep the skipped new lines
-            # in order to preserve formatting
-            elif isinstance(token, tk.TkSkipped):
-                next(tokens)
-                return self.read_next(tokens)
-
-            # Comments, TkAlignment and other single char tokens
-            elif isinstance(token, (tk.TkAlignment, tk.TkParameter, tk.TkSuper,
-                                    tk.TkSub, tk.TkActive, tk.TkComment)):
-                return TeXToken.from_token(next(tokens))
-
-            # Return token if not handled
-            msg = ['\nTokens : ', str(list(tokens)),
-                   '\nParsed :', str(self._master.children),
-                   '\nToken: ', repr(token) ]
-            raise RuntimeError(''.join(msg))
+            # Readers return None when they consume tokens without producing
+            # an element (e.g., skipped whitespace or macros that only change
+            # the context). We simply try again with the next token.
+            while True:
+                token = tokens.tell_next()
+
+                # The tokenizer returns None from tell_next() when we run out 
+                # of tokens. We should return these None's to sinalize the 
+                # parser that there are nothing more to process
+                if token is None:
+                    return None
+
+                try:
+                    reader = readers[type(token)]
+                except KeyError:
+                    reader = self._get_reader(type(token))
+                element = reader(tokens)
+                if element is not None:
+                    return element
 
         # This helps to find bugs in the read_* methods. They should never raise
         # StopIteration due to running out of tokens, but rather we should convert
@@ -229,6 +230,66 @@ class TeXJob:
         except StopIteration:
             raise RuntimeError('StopIteration unhandled in read_next()')
 
+    def _get_reader(self, token_type):
+        '''Return the method that reads elements starting with a token of the
+        given type and save it in the dispatch table used by read_next()'''
+
+        tk = TK
+
+        # Old versions of this code were pushing initialized TeXElements to the
+        # tokenizer. This cannot happen anymore!
+        assert issubclass(token_type, tk.Token), 'invalid type for token: %s' % token_type.__name__
+
+        # Macros
+        if issubclass(token_type, tk.TkEscape):
+            reader = self.read_macro
+
+        # Text tokens
+        elif 10 <= token_type.catcode <= 12:
+            reader = self.read_text
+
+        # Groups
+        elif issubclass(token_type, tk.TkBGroup):
+            reader = self.read_group
+
+        # Math
+        elif issubclass(token_type, tk.TkMath):
+            reader = self.read_math
+
+        # TkSkipped text can be either a skipped whitespace or a skipped new line
+        # we are ignoring skipped spaces but trying to keep the skipped new lines
+        # in order to preserve formatting
+        elif issubclass(token_type, tk.TkSkipped):
+            reader = self.read_skipped
+
+        # Comments, TkAlignment and other single char tokens
+        elif issubclass(token_type, (tk.TkAlignment, tk.TkParameter, tk.TkSuper,
+                                     tk.TkSub, tk.TkActive, tk.TkComment)):
+            reader = self.read_single_token
+
+        else:
+            reader = self._read_unhandled
+
+        self._readers[token_type] = reader
+        return reader
+
+    def _read_unhandled(self, tokens):
+        token = tokens.tell_next()
+        msg = ['\nTokens : ', str(list(tokens)),
+               '\nParsed :', str(self._master.children),
+               '\nToken: ', repr(token) ]
+        raise RuntimeError(''.join(msg))
+
+    def read_skipped(self, tokens):
+        '''Consume a skipped token and return None'''
+
+        next(tokens)
+
+    def read_single_token(self, tokens):
+        '''Return a TeXToken element from the next token'''
+
+        return TeXToken.from_token(next(tokens))
+
     def read_text(self, tokens):
         '''Read text from a sequence of tokens. Texts are created from 
         sequences of characters of catcodes CC_SPACE (10), CC_LETTER (11) or 
@@ -236,14 +297,16 @@ class TeXJob:
 
         tk = TK
 
-        # Absorb letters
+        # Absorb letters. Whenever possible, the tokenizer returns whole runs 
+        # of text rather than one token per character
         letters = []
-        for tok in tokens:
-            if 10 <= tok.catcode <= 12:
-                letters.append(tok)
-            else:
-                tokens.push(tok)
-                break
+        with tokens.text_runs():
+            for tok in tokens:
+                if 10 <= tok.catcode <= 12:
+                    letters.append(tok)
+                else:
+                    tokens.push(tok)
+                    break
         data = ''.join(letters)
 
         # Absorb a trailing newline, if it exists
@@ -395,6 +458,89 @@ class TeXJob:
 
         return self._master
 
+    def iter_events(self):
+        r'''Parse the source and yield (event, element) pairs as elements are
+        read, without building the document tree.
+        
+        Groups and environments whose body is a plain sequence of elements 
+        produce a 'begin' event, the events of their children and an 'end' 
+        event. All other elements produce a single 'element' event. Containers
+        are reported empty, since children are never added to them. Memory 
+        usage is thus bounded by the nesting depth rather than by the size of
+        the document.
+        
+        Elements are not revalued and environment bodies are not trimmed. The
+        job cannot be parsed after its events are consumed.
+        
+        Example
+        -------
+        
+        >>> job = TeXJob(r'\begin{center}{a \textbf{b}}\end{center}')
+        >>> for event, elem in job.iter_events():
+        ...     print(event, type(elem).__name__)
+        begin center
+        begin Group
+        element Text
+        element textbf
+        end Group
+        end center
+        '''
+
+        tk = TK
+        readers = self._readers
+        tokens = self._tokens
+        frames = []
+
+        while True:
+            token = tokens.tell_next()
+
+            # End of group or environment: resume reading with the enclosing
+            # tokenizer
+            if token is None:
+                if not frames:
+                    return
+                tokens, container = frames.pop()
+                if isinstance(container, Group):
+                    container.egroup = str(tokens.get_specific(tk.TkEGroup))
+                else:
+                    self.context.end_group()
+                    container.invoke_end(self, tokens)
+                yield ('end', container)
+                continue
+
+            # Groups
+            if isinstance(token, tk.TkBGroup):
+                container = Group(tokens.get_specific(tk.TkBGroup), [], '')
+                frames.append((tokens, container))
+                tokens = tokens.stopping_before(tk.TkEGroup)
+                yield ('begin', container)
+                continue
+
+            # Environments
+            if isinstance(token, tk.TkEscape):
+                macro_cls = self.get_macro(token.macro_name)
+                if issubclass(macro_cls, BeginEnv):
+                    env_cls = macro_cls.read_environment(self, tokens)
+                    if not env_cls.is_streamable():
+                        yield ('element', env_cls.invoke(self, tokens))
+                        continue
+
+                    container = env_cls.invoke_begin(self, tokens)
+                    self.context.begin_group()
+                    frames.append((tokens, container))
+                    tokens = env_cls.body_tokens(tokens)
+                    yield ('begin', container)
+                    continue
+
+            # Other elements are read by a single step of read_next()
+            try:
+                reader = readers[type(token)]
+            except KeyError:
+                reader = self._get_reader(type(token))
+            element = reader(tokens)
+            if element is not None:
+                yield ('element', element)
+
     @property
     def context(self):
         return self._master.context
@@ -436,6 +582,136 @@ def TeX(text, context=None, loaditems=[], packages=[]):
     # Now run!
     return job.parse()
 
+def TeX_many(sources, packages=[], workers=None, chunksize=16, max_pending=None,
+             ordered=True, return_exceptions=False):
+    r'''Parse many independent sources in a pool of worker processes.
+    
+    Sources can be strings with LaTeX code or paths (os.PathLike objects) to 
+    files that are read by the workers. Each worker loads the given packages
+    once, when it starts. 
+    
+    Sources are sent to the workers in chunks of `chunksize` items and at most
+    `max_pending` chunks (default: twice the number of workers) are either 
+    being processed or waiting to be consumed. Hence, large batches never hold
+    all parsed documents in memory at once, as long as results are consumed
+    as they arrive.
+    
+    Parameters
+    ----------
+    
+    sources : iterable
+        An iterable of strings or paths. It is consumed lazily.
+    packages : list
+        Packages loaded by all jobs.
+    workers : int
+        Number of worker processes. Defaults to the number of CPUs. If zero, 
+        all sources are parsed in the current process.
+    ordered : bool
+        If True (default), documents are yielded in the same order as the 
+        sources. Otherwise, (index, document) pairs are yielded as soon as 
+        each chunk is completed.
+    return_exceptions : bool
+        If True, exceptions raised while parsing a source are yielded in the 
+        place of its document. Otherwise, the first error is re-raised.
+    
+    Example
+    -------
+    
+    >>> list(TeX_many([r'\hello world', r'$x$'], workers=0))
+    [TeXStream([<\hello macro>, 'world']), TeXStream(['$...$'])]
+    '''
+
+    chunks = _iter_chunks(sources, chunksize)
+
+    # Sequential processing
+    if workers == 0:
+        for chunk in chunks:
+            for idx, result in _parse_chunk(chunk, packages, return_exceptions):
+                yield result if ordered else (idx, result)
+        return
+
+    # Imported here: concurrent.futures and multiprocessing are slow to load
+    # and only needed by this function
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(packages,)) as pool:
+        pending = {}    # future: chunk number
+        finished = {}   # chunk number: results that cannot be yielded yet
+        next_chunk = 0
+        chunks = enumerate(chunks)
+        exhausted = False
+
+        while True:
+            # Submit new chunks until the limit is reached. Finished chunks 
+            # that wait for an earlier chunk also count.
+            while not exhausted and len(pending) + len(finished) < max_pending:
+                try:
+                    num, chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    future = pool.submit(_parse_chunk, chunk, packages, return_exceptions)
+                    pending[future] = num
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                num = pending.pop(future)
+                if ordered:
+                    finished[num] = future.result()
+                else:
+                    yield from future.result()
+
+            while next_chunk in finished:
+                for _, result in finished.pop(next_chunk):
+                    yield result
+                next_chunk += 1
+
+def _iter_chunks(sources, chunksize):
+    '''Yield lists of at most chunksize (index, source) pairs'''
+
+    chunk = []
+    for item in enumerate(sources):
+        chunk.append(item)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _init_worker(packages):
+    '''Load modules and packages in a new worker process'''
+
+    TeXJob('warm up', packages=packages).parse()
+
+def _parse_chunk(chunk, packages, return_exceptions):
+    '''Parse a list of (index, source) pairs and return a list of 
+    (index, document) pairs'''
+
+    results = []
+    for idx, source in chunk:
+        try:
+            if isinstance(source, os.PathLike):
+                with open(source) as F:
+                    source = F.read()
+            result = TeXJob(source, packages=packages).parse()
+        except Exception as ex:
+            # Exceptions must be sent back to the main process
+            import pickle
+            try:
+                pickle.dumps(ex)
+            except Exception:
+                ex = RuntimeError('%s: %s' % (type(ex).__name__, ex))
+            if not return_exceptions:
+                raise ex
+            result = ex
+        results.append((idx, result))
+    return results
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod(report=True, optionflags=doctest.REPORT_ONLY_FIRST_FAILURE)
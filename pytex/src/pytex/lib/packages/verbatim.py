@@ -0,0 +1,15 @@
+'''
+The verbatim package.
+
+Besides the verbatim environments of LaTeX, the package defines the comment
+environment. LaTeX ignores its contents, which are read verbatim and kept in 
+the source of the document.
+'''
+
+if __name__ == '__main__':
+    import pytex.lib.packages; __package__ = 'pytex.lib.packages'  # @ReservedAssignment @UnusedImport
+
+from ...textypes import tex_environments
+
+class comment(tex_environments.Verbatim):
+    pass
@@ -1,6 +1,7 @@
 if __name__ == '__main__':
     import pytex; __package__ = 'pytex'  # @ReservedAssignment @UnusedImport
 
+import os
 import re
 from importlib import import_module
 from collections import MutableMapping
@@ -8,11 +9,15 @@ from .errors import PackageImportError
 from .textypes.macro import Macro, Command
 from .textypes.environment import Environment
 
-__all__ = ['register_package', 'register_path', 'load_packages', 'load_package', 'Package', 'LATEX', 'TEX']
+__all__ = ['register_package', 'register_path', 'load_packages', 'load_package', 
+           'find_package', 'build_manifest', 'write_manifest', 'set_lazy',
+           'Package', 'LATEX', 'TEX']
 
 PACKAGES = {}
 LIB_PATHS = ['pytex.lib.packages']
 LATEX_PACKAGES = ['@LaTeX', '@TeX']
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'lib', 'manifest.json')
+MANIFEST = None
 
 def register_package(name, package):
     '''Register the given module in the packages dictionary'''
@@ -40,6 +45,12 @@ def load_package(name):
     try:
         return PACKAGES[name]
     except KeyError:
+        if MANIFEST is not None and name in MANIFEST['packages']:
+            module = MANIFEST['packages'][name]
+            package = Package.from_module(module, name=name)
+            PACKAGES[name] = package
+            return package
+
         for path in reversed(LIB_PATHS):
             try:
                 package = Package.from_module(path + '.' + name, name=name)
@@ -52,13 +63,109 @@ def load_package(name):
     PACKAGES[name] = package
     return package
 
+#===============================================================================
+# Lazy packages
+#===============================================================================
+def set_lazy(lazy=True, path=None):
+    r'''Enable or disable the lazy package mode.
+    
+    In lazy mode, the manifest file in the given path (defaults to 
+    MANIFEST_PATH) is used to find the package that defines each macro. Contexts 
+    import and load a package only when one of its macros is first looked up.
+    
+    Example
+    -------
+    
+    >>> set_lazy(); find_package('foo') is None
+    True
+    >>> find_package('comment')
+    'verbatim'
+    
+    The macro is loaded with its package on first use, and it is the same 
+    macro that the eagerly loaded package defines
+    
+    >>> from pytex import Context
+    >>> ctx = Context()
+    >>> ctx.has_package('verbatim')
+    False
+    >>> lazy = ctx.get_macro('comment')
+    >>> ctx.has_package('verbatim')
+    True
+    >>> set_lazy(False)
+    >>> lazy is Context(['verbatim']).get_macro('comment')
+    True
+    '''
+
+    global MANIFEST
+
+    if lazy:
+        import json
+
+        with open(path or MANIFEST_PATH, encoding='utf8') as F:
+            MANIFEST = json.load(F)
+    else:
+        MANIFEST = None
+
+def find_package(macro_name):
+    '''Return the name of the package that defines the given macro or None if 
+    it is not in the manifest or the lazy mode is disabled'''
+
+    if MANIFEST is None:
+        return None
+    return MANIFEST['macros'].get(macro_name)
+
+def build_manifest(paths=None):
+    '''Return the manifest of all packages in the given module paths (defaults
+    to LIB_PATHS). 
+    
+    The manifest is a dictionary with a "packages" dictionary mapping package 
+    names to module names and a "macros" dictionary mapping macro names to the
+    package that defines them.
+    
+    The manifest shipped with pytex must be up to date
+    
+    >>> import json
+    >>> with open(MANIFEST_PATH, encoding='utf8') as F:
+    ...     json.load(F) == build_manifest()
+    True
+    '''
+
+    import pkgutil
+
+    packages, macros = {}, {}
+    for path in (LIB_PATHS if paths is None else paths):
+        module = import_module(path)
+        for info in pkgutil.iter_modules(module.__path__):
+            modname = '%s.%s' % (path, info.name)
+            package = Package.from_module(modname, name=info.name)
+            packages[package.name] = modname
+            for macro_name in package.macro_names():
+                macros.setdefault(macro_name, package.name)
+    return {'packages': packages, 'macros': macros}
+
+def write_manifest(path=None, paths=None):
+    '''Write the manifest of packages in the given module paths to a JSON file.
+    
+    This is executed at build time by running ``python -m pytex.package [path]``.'''
+
+    import json
+
+    manifest = build_manifest(paths)
+    with open(path or MANIFEST_PATH, 'w', encoding='utf8') as F:
+        json.dump(manifest, F, indent=1, sort_keys=True)
+
+#===============================================================================
+# Package class
+#===============================================================================
 class Package(MutableMapping):
     '''Class that represents a package. 
     
-    A Package is essentially a dictionary mapping names to macros'''
+    A Package is essentially a dictionary mapping names to macros. The 
+    ``revision`` attribute is incremented each time the package is modified.'''
 
     def __init__(self, name, **kwds):
         self.name = name
+        self.revision = 0
         self._data = {}
         self._data.update(kwds)
 
@@ -95,13 +202,29 @@ class Package(MutableMapping):
 
     def __setitem__(self, key, value):
         self._data[key] = value
+        self.revision += 1
 
     def __delitem__(self, key):
         del self._data[key]
+        self.revision += 1
 
     def __repr__(self):
         return 'Package(%r)' % self.name
 
+    def macro_names(self):
+        '''Return a list with the names of all macros that the package 
+        defines in a context'''
+
+        names = []
+        for obj in self.values():
+            if isinstance(obj, type):
+                if issubclass(obj, Macro):
+                    names.append(obj.macro_name)
+                elif issubclass(obj, Environment):
+                    names.append(obj.begin_macro.macro_name)
+                    names.append(obj.end_macro.macro_name)
+        return names
+
     NAME_REGEX = re.compile(r'^\\[a-zA-Z@]+')
     def add_commands(self, tex, base=Command):
         '''Automatically create commands from a template'''
@@ -131,4 +254,11 @@ class Package(MutableMapping):
 # Instantiate LaTeX and TeX packages
 #===============================================================================
 LATEX = None
-TEX = None
\ No newline at end of file
+TEX = None
+
+if __name__ == '__main__':
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else MANIFEST_PATH
+    write_manifest(path)
+    print('manifest written to %s' % path)
@@ -8,6 +8,8 @@ from .macro import Macro, Command
 from .environment import Environment
 from .containers import *
 from .texmath import *
+from .persistent import *
+from .selectors import *
 
 # Extra environment and macros
 from . import tex_environments as environments
@@ -4,20 +4,28 @@ if __name__ == '__main__' and __package__ is None:
 from copy import deepcopy
 from collections import MutableMapping, UserList, UserDict
 from . import Masterlist, Element, TeXElement, Text
+from .base import _clone_value
 
 class EmptyArg(TeXElement):
     '''Type that represents an empty value in an Arguments list'''
 
+    __slots__ = ['_masterlist']
+
     def __bool__(self):
         return False
 
     def source(self):
         return ''
 
+    def _clone_(self):
+        return self._clone_object_()
+
 class Arguments(Masterlist, TeXElement, MutableMapping):
     '''Represents a dictionary mapping argument names to values in a Macro or
     environment.'''
 
+    __slots__ = ['_masterlist', 'owner', '_argspec']
+
     #===========================================================================
     # Magic methods
     #===========================================================================
@@ -80,6 +88,14 @@ class Arguments(Masterlist, TeXElement, MutableMapping):
         new.owner = None
         return new
 
+    def _clone_(self):
+        # The argspec is shared and the owner is set by the cloned macro
+        values = [_clone_value(x) for x in Masterlist.__iter__(self)]
+        new = type(self)._from_unlinked(values)
+        new._argspec = self._argspec
+        new.owner = None
+        return new
+
     #===========================================================================
     # Dictionary interface
     #===========================================================================
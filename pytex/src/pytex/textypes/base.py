@@ -3,7 +3,8 @@ if __name__ == '__main__':
 
 from collections import MutableSequence
 import copy
-from . import Element, Container
+from . import Element, Container, Masterlist
+from ..types.prevnext import _slot_names
 from .. import tokens as tk
 from ..util.splitters import strip
 from collections.abc import Iterable
@@ -14,9 +15,15 @@ from collections.abc import Iterable
 class TeXElement(Element):
     '''Base class for all parsed TeX objects'''
 
+    __slots__ = ()
     force_expand = False
     macro_name = None
 
+    # Tuple with the types of all objects that may appear in the subtree of
+    # the element or None if any type is allowed. Used by walk_items() to 
+    # skip subtrees.
+    subitem_types = None
+
     def __init__(self):
         pass
 
@@ -73,10 +80,88 @@ class TeXElement(Element):
         return self
 
     def copy(self):
-        '''Return a deepcopy of itself'''
+        r'''Return an unlinked deep copy of itself.
+        
+        Copies are created with the _clone_() protocol, which is much faster
+        than copy.deepcopy().
+        
+        >>> from pytex import TeXJob
+        >>> bf = TeXJob(r'\textbf{foo} bar').parse().children[0]
+        >>> cp = bf.copy()
+        >>> cp, cp.parent
+        (<\textbf{foo} macro>, None)
+        
+        Cloned arguments are owned by the copy and changing them does not
+        affect the original
+        
+        >>> cp.args.owner is cp, cp.args['data'].parent is cp
+        (True, True)
+        >>> cp.args['data'].add(Text('!'))
+        >>> cp.source(), bf.source()
+        ('\\textbf{foo!}', '\\textbf{foo}')
+        '''
+
+        return self._clone_()
+
+    def select(self, selector):
+        '''Return a list with all elements in the tree that match the given
+        CSS-like selector (see pytex.textypes.selectors)'''
+
+        from .selectors import compile_selector
+        return compile_selector(selector).select(self)
+
+    def select_first(self, selector):
+        '''Return the first element in the tree that matches the given
+        selector or None'''
+
+        from .selectors import compile_selector
+        return compile_selector(selector).select_first(self)
+
+    def _clone_(self):
+        '''Return an unlinked copy of itself.
+        
+        Subclasses override this method to copy only their mutable structure.
+        Immutable data such as strings and tokens is shared with the original. 
+        The default implementation uses copy.deepcopy().'''
 
         return copy.deepcopy(self)
 
+    def _clone_state_(self, new):
+        '''Copy the attributes of self into new, except for the children and 
+        the link to the masterlist.
+        
+        TeXElements are cloned, immutable values are shared and all other 
+        values are deep copied. Cloned arguments are owned by new.'''
+
+        for name in _clone_slots(type(self)):
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            object.__setattr__(new, name, self._clone_attr_(value, new))
+
+        state = getattr(self, '__dict__', None)
+        if state:
+            new.__dict__.update({name: self._clone_attr_(value, new) 
+                                 for name, value in state.items()
+                                 if name not in _CLONE_SKIP})
+
+    def _clone_attr_(self, value, new):
+        cp = _clone_value(value)
+        if cp is not value and getattr(value, 'owner', None) is self:
+            cp.owner = new
+            if value.parent is self:
+                cp.parent = new
+        return cp
+
+    def _clone_object_(self):
+        '''Implementation of _clone_() for elements that are not derived from 
+        builtin types'''
+
+        new = object.__new__(type(self))
+        self._clone_state_(new)
+        return new
+
     @property
     def context(self):
         try:
@@ -91,6 +176,33 @@ class TeXElement(Element):
             master = master.parent
         return master
 
+#===============================================================================
+# Clone protocol
+#===============================================================================
+_CLONE_SKIP = {'_masterlist', '_children'}
+_CLONE_SLOTS = {}
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, type(None), frozenset, type)
+
+def _clone_slots(cls):
+    '''Return the names of the slots of cls that are copied by _clone_state_()'''
+
+    try:
+        return _CLONE_SLOTS[cls]
+    except KeyError:
+        names = [x for x in _slot_names(cls) if x not in _CLONE_SKIP]
+        return _CLONE_SLOTS.setdefault(cls, names)
+
+def _clone_value(value):
+    '''Clone TeXElements, share immutable values and deep copy everything
+    else'''
+
+    if isinstance(value, TeXElement):
+        return value._clone_()
+    elif isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    else:
+        return copy.deepcopy(value)
+
 #===============================================================================
 # String Types
 #===============================================================================
@@ -109,7 +221,7 @@ class TeXString(TeXElement, str):
     *'foobar'
     '''
 
-    __slots__ = []
+    __slots__ = ['_masterlist']
 
     def __new__(cls, st):
         if not isinstance(st, str):
@@ -147,6 +259,11 @@ class TeXString(TeXElement, str):
     def source(self):
         return str.__str__(self)
 
+    def _clone_(self):
+        new = str.__new__(type(self), self)
+        self._clone_state_(new)
+        return new
+
     # String methods -----------------------------------------------------------
     def capitalize(self): return type(self)(str.capitalize(self))
     def lower(self): return type(self)(str.lower(self))
@@ -180,13 +297,19 @@ class TeXString(TeXElement, str):
 class TeXComment(TeXString):
     '''Represents a line of comment'''
 
+    __slots__ = []
+
 class Text(TeXString):
     '''Represents a text fragment'''
 
+    __slots__ = []
+
 class SkippedLine(TeXString):
     '''Represents a text fragment (usually whitespace) that were skipped during
     TeX processing'''
 
+    __slots__ = []
+
     def __repr__(self):
         return '*' + TeXString.__repr__(self)
 
@@ -199,6 +322,7 @@ class TeXToken(TeXElement):
     This class cannot be used direclty, but one should use one of its subclasses 
     bellow.'''
 
+    __slots__ = ['_masterlist', '_token']
     _TOKEN_CLASSES = {}
     token_type = None
 
@@ -214,6 +338,9 @@ class TeXToken(TeXElement):
     def source(self):
         return str(self._token)
 
+    def _clone_(self):
+        return self._clone_object_()
+
     def __eq__(self, other):
         if isinstance(other, TeXToken):
             return self._token == other._token
@@ -250,26 +377,32 @@ class TeXToken(TeXElement):
 # (They should be converted from Token to TeXElements to be in a TeX document, though)
 @TeXToken.register
 class Alignment(TeXToken):
+    __slots__ = []
     token_type = tk.TkAlignment
 
 @TeXToken.register
 class Parameter(TeXToken):
+    __slots__ = []
     token_type = tk.TkParameter
 
 @TeXToken.register
 class Super(TeXToken):
+    __slots__ = []
     token_type = tk.TkSuper
 
 @TeXToken.register
 class Sub(TeXToken):
+    __slots__ = []
     token_type = tk.TkSub
 
 @TeXToken.register
 class Active(TeXToken):
+    __slots__ = []
     token_type = tk.TkActive
 
 @TeXToken.register
 class Comment(TeXToken):
+    __slots__ = []
     token_type = tk.TkComment
 
 #===============================================================================
@@ -282,6 +415,7 @@ class TeXContainer(Container, TeXElement):
     children_source() method that returns a string with the source code of all 
     children.'''
 
+    __slots__ = ()
     trim_newlines = False
 
     def __init__(self, *, children=None):
@@ -295,6 +429,12 @@ class TeXContainer(Container, TeXElement):
         except ValueError:
             raise ValueError('trying to include objects that already have parents')
 
+    def _clone_(self):
+        new = self._clone_object_()
+        children = [_clone_value(x) for x in self._children]
+        new._children = Masterlist._from_unlinked(children, new)
+        return new
+
     def __repr__(self):
         children = [ repr(x) for x in self ]
         if len(children) > 7:
@@ -338,58 +478,95 @@ class TeXContainer(Container, TeXElement):
                 raise ValueError('cannot add %s object' % tname)
         else:
             if isinstance(obj, Join):
-                children.add(obj.clear(), index)
+                children.splice(index, 0, obj.clear())
             elif isinstance(obj, TeXElement):
                 children.insert(index, obj)
             else:
-                for elem in reversed(obj):
-                    self.add(elem, index)
+                children.splice(index, 0, obj)
+
+    def splice(self, index, delete_count, new_elements):
+        '''Remove delete_count children starting at index and insert the new
+        elements at their place. Return a list with the removed children.'''
+
+        return self.children.splice(index, delete_count, new_elements)
+
+    def replace_with_many(self, elem, elems):
+        '''Replace the child elem by all elements in the sequence elems'''
+
+        self.children.replace_with_many(elem, elems)
 
     def get(self, arg):
         '''Return some child element.
         
         If arg is int, return children at the given index. If arg is a type, 
-        return the first children of the given type.'''
+        return the first children of the given type.
+        
+        >>> L = List([Text('a'), SkippedLine('b'), Text('c'), SkippedLine('d')])
+        >>> L.get(1), L.get(SkippedLine), L.get_all(SkippedLine)
+        (*'b', *'b', [*'b', *'d'])
+        >>> L.get(Group)
+        Traceback (most recent call last):
+        ...
+        ValueError: no child of type Group
+        '''
 
         if isinstance(arg, int):
             return self.children[arg]
         elif isinstance(arg, type) and issubclass(arg, TeXElement):
-            try:
-                return next(x for x in self if isinstance(x, arg))
-            except StopIteration:
-                raise ValueError('no child of type %s' % arg.__name__)
+            return self._first_of_type(arg)
         else:
             raise TypeError(type(arg))
 
     def get_all(self, tt):
-        '''Return all children of the given type'''
+        '''Return all children of the given type.
+        
+        Type lookups use the type index of the children list and do not scan
+        all children.'''
 
-        return [ x for x in self if isinstance(x, tt) ]
+        return self.children.of_type(tt)
+
+    def _first_of_type(self, tt):
+        value = self.children.first_of_type(tt)
+        if value is None:
+            raise ValueError('no child of type %s' % tt.__name__)
+        return value
 
     def replace(self, arg, value):
         '''Replace the child at given index or at the position of the first child
-        of the given type'''
+        of the given type
+        
+        >>> L = List([Text('a'), SkippedLine('b'), SkippedLine('c')])
+        >>> L.replace(SkippedLine, Text('x'))
+        >>> L
+        List(['a', 'x', *'c'])
+        '''
 
         if isinstance(arg, int):
             self.children[arg] = value
         elif isinstance(arg, type) and issubclass(arg, TeXElement):
-            try:
-                value = next(x for x in self if isinstance(x, arg))
-            except StopIteration:
-                raise ValueError('no child of type %s' % arg.__name__)
-            value.replace_by(value)
+            self._first_of_type(arg).replace_by(value)
         else:
             raise TypeError(type(arg))
 
     def pop(self, arg=None):
-        '''Pops the child at the given position (or first child of given type'''
+        '''Pops the child at the given position (or first child of given type).
+        Raises ValueError if there is no child of the given type.
+        
+        >>> L = List([Text('a'), SkippedLine('b')])
+        >>> L.pop(SkippedLine), L
+        (*'b', List(['a']))
+        >>> L.pop(SkippedLine)
+        Traceback (most recent call last):
+        ...
+        ValueError: no child of type SkippedLine
+        '''
 
         if arg is None:
             return self.children.pop()
         elif isinstance(arg, int):
             return self.children.pop(arg)
         else:
-            value = next(iter(x for x in self if isinstance(x, arg)))
+            value = self._first_of_type(arg)
             value.unlink()
             return value
 
@@ -404,7 +581,7 @@ class TeXContainer(Container, TeXElement):
     def remove_all(self, tt):
         '''Remove all elements of the given type'''
 
-        for obj in self.get_all(tt):
+        for obj in self.children.of_type(tt):
             obj.unlink()
 
     def clear(self):
@@ -429,7 +606,27 @@ class TeXContainer(Container, TeXElement):
     def revalue(self, method, *args, **kwds):
         '''Post-parsing in container types simply apply this function to the 
         first child and then subsequently to its .next attribute until the list
-        ends'''
+        ends.
+
+        Children revalued to a new plain Join are replaced by the contents of
+        the Join. Subclasses of Join, such as TabularLine, and Joins that are
+        already children of the container (e.g., the alternatives of a macro)
+        are kept as a single child
+
+        >>> from pytex.textypes.tex_environments import TabularLine
+        >>> class Twice(Text):
+        ...     def revalue_split(self):
+        ...         return Join([Text(self), Text(self)])
+        >>> class Line(Text):
+        ...     def revalue_split(self):
+        ...         return TabularLine([Text(self)])
+        >>> body = List([Twice('a'), Line('b'), Text('c')])
+        >>> body.revalue('split')
+        List(['a', 'a', TabularLine(['b']), 'c'])
+        >>> body = List([Join([Text('a'), Text('b')]), Text('c')])
+        >>> body.revalue('split')
+        List([Join(['a', 'b']), 'c'])
+        '''
 
         if self.children:
             obj = self.children[0]
@@ -438,6 +635,9 @@ class TeXContainer(Container, TeXElement):
                 nxt = obj.next
                 if new is None:
                     obj.unlink()
+                elif type(new) is Join and new is not obj:
+                    # New Joins are expanded in place
+                    self.children.replace_with_many(obj, new.clear())
                 elif new is not obj:
                     try:
                         obj.replace_by(new)
@@ -461,6 +661,8 @@ class TeXContainer(Container, TeXElement):
 class Sequence(TeXContainer, MutableSequence):
     '''Represents a sequence of TeXElements'''
 
+    __slots__ = ()
+
     def __init__(self, data=()):
         super(Sequence, self).__init__(children=data)
 
@@ -533,11 +735,13 @@ class Sequence(TeXContainer, MutableSequence):
         return value
 
 class Join(Sequence):
-    pass
+    __slots__ = ()
 
 class Group(Sequence):
     '''Represents grouped elements. Usually items like {<children>}'''
 
+    __slots__ = ['bgroup', 'egroup']
+
     def __init__(self, bgroup, data, egroup):
         super(Group, self).__init__(data)
         self.bgroup = str(bgroup)
@@ -558,6 +762,8 @@ class Group(Sequence):
 class List(Sequence):
     '''A TeXElement that behaves like a python list'''
 
+    __slots__ = ['sep', 'blist', 'elist']
+
     def __init__(self, data, sep=', ', brackets='[]'):
         brackets = brackets or ('', '')
         self.sep = str(sep)
@@ -107,23 +107,52 @@ class Environment(TeXContainer, metaclass=EnvironmentMeta):
         '''
 
         # Read \beginenvironment macro and its arguments
-        new = cls.new()
-        macro = cls.invoke_macro(job, tokens, new)
-        new.args = macro.args
-        new.args.owner = new
+        new = cls.invoke_begin(job, tokens)
 
         # Invoke the contents of the body
         with job.context.grouping():
-            trunc_tokens = tokens.stopping_before_macro(cls.end_macro.macro_name)
-            body = cls.invoke_body(job, trunc_tokens, new)
+            body = cls.invoke_body(job, cls.body_tokens(tokens), new)
             if not isinstance(body, (list, tuple)):
                 raise ValueError('invoke_body must return a list, got %s' % type(body).__name__)
             new.add(body)
 
         # Get the \endenvironment macro
-        tokens.get_macro(cls.end_macro.macro_name)
+        cls.invoke_end(job, tokens)
+        return new
+
+    @classmethod
+    def invoke_begin(cls, job, tokens):
+        '''Read the \beginenvironment macro and return a new empty environment
+        with its arguments'''
+
+        new = cls.new()
+        macro = cls.invoke_macro(job, tokens, new)
+        new.args = macro.args
+        new.args.owner = new
         return new
 
+    @classmethod
+    def body_tokens(cls, tokens):
+        '''Return a tokenizer that stops before the \endenvironment macro'''
+
+        return tokens.stopping_before_macro(cls.end_macro.macro_name)
+
+    @classmethod
+    def invoke_end(cls, job, tokens):
+        '''Read the \endenvironment macro'''
+
+        tokens.get_macro(cls.end_macro.macro_name)
+
+    @classmethod
+    def is_streamable(cls):
+        '''Return True if the environment body is a plain sequence of elements,
+        i.e., invoke() and invoke_body() are not overridden. The children of
+        these environments can be reported one by one by 
+        TeXJob.iter_events()'''
+
+        return (cls.invoke.__func__ is Environment.invoke.__func__ and
+                cls.invoke_body.__func__ is Environment.invoke_body.__func__)
+
     @classmethod
     def invoke_macro(cls, job, tokens, new):
         '''This classmethod should return the \beginenvironment macro initialized
@@ -163,11 +192,17 @@ class BeginEnv(Command):
 
     @classmethod
     def invoke(cls, job, tokens):
+        return cls.read_environment(job, tokens).invoke(job, tokens)
+
+    @classmethod
+    def read_environment(cls, job, tokens):
+        '''Read \begin{env} and return the corresponding Environment class. The
+        \beginenv token is pushed back to the token stream'''
+
         bcmd = super(BeginEnv, cls).invoke(job, tokens)
         btok = tk.TkEscape(bcmd.command_name[0] + bcmd.env_name)
         tokens.push(btok)
-        beginenv = job.get_environment(bcmd.env_name, warn=1)
-        return beginenv.invoke(job, tokens)
+        return job.get_environment(bcmd.env_name, warn=1)
 
 class EndEnv(Command):
     '''End of an environment'''
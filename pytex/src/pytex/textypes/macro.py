@@ -10,7 +10,7 @@ __all__ = ['Macro', 'Command']
 NoneType = type(None)
 
 class Macro(TeXElement, metaclass=MacroMeta):
-    '''Base macro class. Represents unexpanded macros and implements the 
+    r'''Base macro class. Represents unexpanded macros and implements the 
     invoke()/expand() mechanism.
     
     Apart from the regular initialization, Macro instances can be initializated
@@ -24,7 +24,27 @@ class Macro(TeXElement, metaclass=MacroMeta):
     which mimmicks the way that the TeX processor works is to push tokens and 
     then return None so the object is not added to the document. 
     
+    Macros keep all their data in the `args` attribute. The metaclass gives
+    empty __slots__ to subclasses that do not define them, so macro instances
+    have no __dict__. Subclasses that need other instance attributes must 
+    declare them in __slots__.
+    
+    >>> from pytex import TeXJob
+    >>> doc = TeXJob(r'\textbf{foo} bar').parse()
+    >>> [hasattr(x, '__dict__') for x in doc.children]
+    [False, False]
+    
+    Old style definitions that declare args as a class attribute keep a
+    __dict__ for their arguments
+    
+    >>> class oldstyle(Command):
+    ...     args = '{data}'
+    >>> 'args' in vars(oldstyle())
+    True
+    >>> TeXJob(r'\emph{foo} bar').parse().source()
+    '\\emph{foo} bar'
     '''
+    __slots__ = ['_masterlist', 'args']
     is_abstract = True
     force_expand = False
     argspec = ''
@@ -41,6 +61,9 @@ class Macro(TeXElement, metaclass=MacroMeta):
     def __repr__(self):
         return '<%s%s macro>' % (self.command_name, self.args.source(trunc=8))
 
+    def _clone_(self):
+        return self._clone_object_()
+
     def _subitems_(self):
         return iter(self.args)
 
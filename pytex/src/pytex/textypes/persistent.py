@@ -0,0 +1,200 @@
+r'''
+Persistent document trees.
+
+A frozen tree is an immutable copy of a document. Revaluing a frozen tree
+returns a new tree that shares all unchanged subtrees with the original, so
+many versions of the same document cost little more than their differences.
+
+>>> from pytex import TeXJob
+>>> class Version(Text):
+...     __slots__ = []
+...     def revalue_version(self, idx):
+...         return Text('v%s' % idx)
+>>> doc = TeXJob(r'\textbf{foo} {bar}').parse()
+>>> doc.add(Version('v'))
+>>> frozen = freeze(doc)
+>>> v1, v2 = frozen.revalue('version', 1), frozen.revalue('version', 2)
+>>> v1.source(), v2.source()
+('\\textbf{foo} {bar}v1', '\\textbf{foo} {bar}v2')
+
+Unchanged subtrees are shared
+
+>>> v1.children[0] is v2.children[0] is frozen.children[0]
+True
+
+Frozen trees are immutable and do not see later changes to the original
+document. thaw() returns an independent mutable copy
+
+>>> frozen.children = ()
+Traceback (most recent call last):
+...
+AttributeError: Frozen objects are immutable
+>>> doc.add(Text('!'))
+>>> thawed = frozen.thaw()
+>>> thawed.add(Text('?'))
+>>> doc.source(), frozen.source(), thawed.source()
+('\\textbf{foo} {bar}v!', '\\textbf{foo} {bar}v', '\\textbf{foo} {bar}v?')
+
+Subtrees without revalue methods are returned unchanged
+
+>>> frozen.children[0].revalue('version', 1) is frozen.children[0]
+True
+'''
+
+if __name__ == '__main__':
+    import pytex.textypes; __package__ = 'pytex.textypes'  # @ReservedAssignment @UnusedImport
+
+from . import Masterlist, TeXElement, TeXContainer, Text  # @UnusedImport
+from .macro import Macro
+from .containers import TeXStream
+from ..util.iterators import walk_items
+
+__all__ = ['Frozen', 'freeze']
+
+#===============================================================================
+# Frozen nodes
+#===============================================================================
+class Frozen:
+    '''An immutable node of a persistent document tree.
+
+    Each node holds a template element, which is never modified or linked to
+    any list, and a tuple with the frozen children of containers (None for
+    other elements). Nodes are created by freeze() and by revalue().'''
+
+    __slots__ = ['template', 'children', '_dynamic']
+
+    def __init__(self, template, children=None):
+        self.template = template
+        self.children = children
+        self._dynamic = {}
+
+    def __repr__(self):
+        return 'Frozen(%r)' % self.template
+
+    def __setattr__(self, attr, value):
+        if hasattr(self, '_dynamic'):
+            raise AttributeError('Frozen objects are immutable')
+        object.__setattr__(self, attr, value)
+
+    def source(self):
+        '''Return a string with the source code of the frozen element'''
+
+        return self.thaw().source()
+
+    def thaw(self):
+        '''Return a new mutable copy of the element'''
+
+        new = self.template._clone_()
+        if self.children is not None:
+            children = [child.thaw() for child in self.children]
+            new._children = Masterlist._from_unlinked(children, new)
+        return new
+
+    def walk(self):
+        '''Iterate over all nodes of the tree'''
+
+        yield self
+        for child in self.children or ():
+            yield from child.walk()
+
+    def is_dynamic(self, method):
+        '''Return True if revalue(method) may change the node or any node in
+        its subtree'''
+
+        try:
+            return self._dynamic[method]
+        except KeyError:
+            pass
+
+        if self.children is None:
+            dynamic = any(_responds(type(x), method) for x in walk_items(self.template))
+        else:
+            dynamic = (_responds(type(self.template), method) or
+                       any(child.is_dynamic(method) for child in self.children))
+        self._dynamic[method] = dynamic
+        return dynamic
+
+    def revalue(self, method, *args, **kwds):
+        '''Return a new frozen tree with the result of revaluing the element.
+
+        The element is revalued as a mutable tree which only contains the
+        nodes that may change, their ancestors and the siblings of these
+        nodes. All other subtrees are shared with the original tree.
+
+        Revalue methods must not modify the contents of sibling containers.
+        The result is None if the element was revalued to None.'''
+
+        if not self.is_dynamic(method):
+            return self
+
+        standins = {}
+        element = self._skeleton(method, standins)
+        result = element.revalue(method, *args, **kwds)
+        if result is None:
+            return None
+        return _freeze_owned(result, standins)
+
+    def _skeleton(self, method, standins):
+        '''Return a mutable copy of the node for revalue(). Nodes that do not
+        change are replaced by stand-ins without children'''
+
+        if not self.is_dynamic(method):
+            new = self.template._clone_()
+            standins[id(new)] = (new, self)
+        elif self.children is None or not _is_generic(type(self.template), method):
+            new = self.thaw()
+        else:
+            new = self.template._clone_()
+            children = [child._skeleton(method, standins) for child in self.children]
+            new._children = Masterlist._from_unlinked(children, new)
+        return new
+
+def freeze(element):
+    '''Return a frozen copy of element. Later changes to the element do not
+    affect its frozen copy'''
+
+    return _freeze_owned(element.copy(), {})
+
+def _freeze_owned(element, standins):
+    '''Freeze an element that is not used anywhere else, reusing the frozen
+    nodes of the stand-ins'''
+
+    try:
+        standin, node = standins[id(element)]
+        if standin is element:
+            return node
+    except KeyError:
+        pass
+
+    if isinstance(element, TeXContainer):
+        children = element.children.clear()
+        children = tuple(_freeze_owned(x, standins) for x in children)
+        return Frozen(element, children)
+    else:
+        return Frozen(element)
+
+#===============================================================================
+# Revalue methods
+#===============================================================================
+# revalue() implementations that only revalue the children and can be executed
+# with stand-ins in place of unchanged children
+_GENERIC_REVALUE = {TeXElement.revalue, TeXContainer.revalue,
+                    TeXStream.revalue, Macro.revalue}
+_RESPONDS = {}
+
+def _is_generic(cls, method):
+    name = 'revalue_' + method
+    return (cls.revalue in _GENERIC_REVALUE and
+            getattr(cls, name, None) is getattr(TeXElement, name, None))
+
+def _responds(cls, method):
+    '''Return True if instances of cls may be changed by revalue(method)'''
+
+    try:
+        return _RESPONDS[cls, method]
+    except KeyError:
+        return _RESPONDS.setdefault((cls, method), not _is_generic(cls, method))
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
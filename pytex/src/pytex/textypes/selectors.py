@@ -0,0 +1,384 @@
+r'''
+CSS-like selectors for parsed TeX documents.
+
+Selectors match macros and environments by name, by the values of their
+arguments and by their position in the tree.
+
+>>> from pytex import TeXJob
+>>> doc = TeXJob(r"""\begin{itemize}
+... \item \textbf{foo} \textit{bar}
+... \item \textbf{\textit{baz}}
+... \end{itemize}""").parse()
+>>> doc.select('itemize textbf')
+[<\textbf{foo} macro>, <\textbf{\textit...} macro>]
+
+Supported syntax
+----------------
+
+``name``
+    Macros or environments with the given name. A leading backslash is
+    optional: ``\textbf`` is the same as ``textbf``.
+``*``
+    Any element.
+``[arg]``, ``[arg=value]``
+    Elements with a non-empty argument or whose argument has the given
+    source. The operators ``^=`` (starts with), ``$=`` (ends with) and ``*=``
+    (contains) are also accepted. Names that are not arguments are looked up
+    as attributes of the element.
+``A B``, ``A > B``
+    B elements that are descendants or children of an A element.
+``> B``
+    B elements that are children of the element in which the search starts.
+``A, B``
+    Elements that match A or B.
+
+>>> doc.select('textbf > textit')
+[<\textit{baz} macro>]
+>>> doc.select('textbf[data=foo], textit')
+[<\textbf{foo} macro>, <\textit{bar} macro>, <\textit{baz} macro>]
+
+Search starts at the given element, which also counts as a match. Join
+objects are transparent: the contents of a macro argument are children of the
+macro. Results are listed in document order and each element appears only
+once.
+
+>>> doc.select('> textbf'), doc.select('> itemize > * > textbf')
+([], [<\textbf{foo} macro>, <\textbf{\textit...} macro>])
+>>> doc.select('[data^=\\textit]'), doc.select('textbf[data$=oo]')
+([<\textbf{\textit...} macro>], [<\textbf{foo} macro>])
+
+select_first() stops at the first match and returns None if nothing matches
+
+>>> doc.select_first('textit'), doc.select_first('section')
+(<\textit{bar} macro>, None)
+
+Invalid selectors raise a ValueError
+
+>>> doc.select('textbf >')
+Traceback (most recent call last):
+...
+ValueError: invalid selector at position 8: 'textbf >'
+
+Selectors are compiled once and cached. All selectors in a Selector are
+evaluated in a single pass over the tree
+
+>>> sel = compile_selector(['textbf', 'textit', 'itemize'])
+>>> [len(L) for L in sel.select_many(doc)]
+[2, 2, 1]
+'''
+
+if __name__ == '__main__':
+    import pytex.textypes; __package__ = 'pytex.textypes'  # @ReservedAssignment @UnusedImport
+
+import re
+from . import Masterlist, TeXElement, Join
+from .arguments import Arguments, EmptyArg
+
+__all__ = ['Selector', 'compile_selector', 'select_many']
+
+#===============================================================================
+# Selectors
+#===============================================================================
+class Selector:
+    '''A compiled selector or a list of selectors.
+
+    Use compile_selector() to create selectors: it caches the compiled
+    objects.'''
+
+    def __init__(self, selectors):
+        if isinstance(selectors, str):
+            selectors = [selectors]
+        self.selectors = tuple(selectors)
+
+        # Steps are the compound selectors of all complex selectors. A state is
+        # the index of the next step that must be matched.
+        self._steps = steps = []
+        desc, direct = [], []
+        for output, selector in enumerate(self.selectors):
+            for complex_ in _parse(selector):
+                first = len(steps)
+                for i, (combinator, name, filters) in enumerate(complex_):
+                    last = i == len(complex_) - 1
+                    follows = None if last else complex_[i + 1][0]
+                    steps.append(_Step(name, filters, output if last else None, follows))
+                (direct if complex_[0][0] == '>' else desc).append(first)
+        self._desc = frozenset(desc)
+        self._direct = frozenset(direct)
+        self._dispatch_cache = {}
+
+    def __repr__(self):
+        return 'Selector(%r)' % (', '.join(self.selectors))
+
+    def iter_matches(self, obj):
+        '''Iterate over (idx, element) pairs for all elements that match the
+        idx-th selector'''
+
+        steps = self._steps
+        names = _NAMES
+        dispatch_cache = self._dispatch_cache
+        stack = [iter([obj])]
+        states = [(self._desc, _EMPTY)]
+        push, pop = stack.append, stack.pop
+
+        while stack:
+            try:
+                item = next(stack[-1])
+            except StopIteration:
+                pop()
+                states.pop()
+                continue
+
+            # Joins have no syntax of their own (e.g. macro arguments): their
+            # children are treated as children of the parent element
+            desc, direct = states[-1]
+            if type(item) is Join:
+                if len(stack) == 1:
+                    direct = self._direct
+                push(iter(item.children))
+                states.append((desc, direct))
+                continue
+
+            # Check the active states that may match the element. Descendant
+            # states remain active in the whole subtree and direct states only
+            # in the children of the element that activated them.
+            try:
+                dispatch = dispatch_cache[desc, direct]
+            except KeyError:
+                dispatch = dispatch_cache[desc, direct] = self._dispatch(desc | direct)
+            cls = type(item)
+            try:
+                name = names[cls]
+            except KeyError:
+                name = _element_name(cls)
+            new_desc = new_direct = outputs = ()
+            for state in dispatch.get(name) or dispatch[None]:
+                step = steps[state]
+                if step.filters and not step.matches(item):
+                    continue
+                elif step.output is not None:
+                    if step.output not in outputs:
+                        outputs += (step.output,)
+                        yield step.output, item
+                elif step.follows == '>':
+                    new_direct += (state + 1,)
+                else:
+                    new_desc += (state + 1,)
+
+            child_desc = desc.union(new_desc) if new_desc else desc
+            child_direct = frozenset(new_direct) if new_direct else _EMPTY
+            if len(stack) == 1:
+                child_direct = child_direct.union(self._direct)
+
+            # If there are only direct states, we only need to visit the
+            # children that match them
+            if child_desc:
+                subitems = getattr(item, '_subitems_', None)
+                children = subitems and subitems()
+            elif child_direct:
+                children = _candidates(item, [steps[i] for i in child_direct])
+            else:
+                children = None
+            if children is not None:
+                push(children)
+                states.append((child_desc, child_direct))
+
+    def _dispatch(self, states):
+        '''Return a dictionary mapping element names to the list of states 
+        that may match elements with this name. The None key holds the states
+        that match any name.'''
+
+        anyname = [i for i in states if self._steps[i].name is None]
+        dispatch = {None: anyname}
+        for i in states:
+            name = self._steps[i].name
+            if name is not None:
+                dispatch.setdefault(name, list(anyname)).append(i)
+        return dispatch
+
+    def select(self, obj):
+        '''Return a list of all elements in the tree of obj that match the
+        selector'''
+
+        return [item for _, item in self.iter_matches(obj)]
+
+    def select_first(self, obj):
+        '''Return the first element that matches the selector or None. The
+        search stops at the first match.'''
+
+        for _, item in self.iter_matches(obj):
+            return item
+        return None
+
+    def select_many(self, obj):
+        '''Return a list with the matches of each selector'''
+
+        result = [[] for _ in self.selectors]
+        for idx, item in self.iter_matches(obj):
+            result[idx].append(item)
+        return result
+
+_SELECTORS = {}
+_EMPTY = frozenset()
+
+def compile_selector(selector):
+    '''Return a compiled Selector from a selector string or from a list of
+    selector strings. Compiled selectors are cached.'''
+
+    if isinstance(selector, Selector):
+        return selector
+    key = selector if isinstance(selector, str) else tuple(selector)
+    try:
+        return _SELECTORS[key]
+    except KeyError:
+        return _SELECTORS.setdefault(key, Selector(key))
+
+def select_many(obj, selectors):
+    '''Return a list with the elements that match each selector in the tree
+    of obj. The tree is traversed only once.'''
+
+    return compile_selector(selectors).select_many(obj)
+
+#===============================================================================
+# Matching
+#===============================================================================
+class _Step:
+    '''A compound selector: an optional name and a list of filters'''
+
+    __slots__ = ['name', 'filters', 'output', 'follows']
+
+    def __init__(self, name, filters, output, follows):
+        self.name = name
+        self.filters = filters
+        self.output = output
+        self.follows = follows
+
+    def matches(self, obj):
+        if self.name is not None and _element_name(type(obj)) != self.name:
+            return False
+        for name, op, value in self.filters:
+            found = _get_value(obj, name)
+            if found is None:
+                return False
+            if op is not None and not _OPERATORS[op](found, value):
+                return False
+        return True
+
+_OPERATORS = {
+    '=': str.__eq__,
+    '^=': str.startswith,
+    '$=': str.endswith,
+    '*=': str.__contains__,
+}
+_NAMES = {}
+
+def _element_name(cls):
+    '''Return the environment or macro name of instances of cls'''
+
+    try:
+        return _NAMES[cls]
+    except KeyError:
+        name = getattr(cls, 'env_name', None) or getattr(cls, 'macro_name', None)
+        return _NAMES.setdefault(cls, name)
+
+def _get_value(obj, name):
+    '''Return the source of the given argument or attribute or None if it is
+    empty'''
+
+    args = getattr(obj, 'args', None)
+    if isinstance(args, Arguments):
+        for argname, value in args.items():
+            if argname == name:
+                break
+        else:
+            value = getattr(obj, name, None)
+    else:
+        value = getattr(obj, name, None)
+
+    if value is None or isinstance(value, EmptyArg):
+        return None
+    elif isinstance(value, TeXElement):
+        return value.source().strip()
+    else:
+        return str(value).strip()
+
+def _candidates(obj, steps):
+    '''Return an iterator over the children of obj that may match one of the
+    given steps, or None'''
+
+    subitems = getattr(obj, '_subitems_', None)
+    if subitems is None:
+        return None
+    children = getattr(obj, 'children', None)
+    names = {step.name for step in steps}
+    if None in names or not isinstance(children, Masterlist):
+        return subitems()
+
+    # Use the type index of the children list
+    types = tuple(tt for tt in children.types() if _element_name(tt) in names)
+    return iter(children.of_type(types)) if types else None
+
+#===============================================================================
+# Parser
+#===============================================================================
+_TOKENS = re.compile(r'''
+    \s*(?P<comma>,)\s*
+  | \s*(?P<child>>)\s*
+  | (?P<space>\s+)
+  | (?P<star>\*)
+  | \\?(?P<name>[A-Za-z@][A-Za-z0-9@_*-]*)
+  | \[\s*(?P<attr>[A-Za-z@_][\w@-]*)\s*
+      (?:(?P<op>[\^$*]?=)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]+))\s*)?\]
+''', re.VERBOSE)
+_KINDS = ['comma', 'child', 'space', 'star', 'name', 'attr']
+
+def _parse(selector):
+    '''Return a list of complex selectors. Each complex selector is a list
+    of (combinator, name, filters) tuples'''
+
+    result = []
+    complex_ = []
+    combinator, name, filters, compound = ' ', None, [], False
+    selector = selector.strip()
+    pos = 0
+
+    def error():
+        return ValueError('invalid selector at position %s: %r' % (pos, selector))
+
+    while pos < len(selector):
+        m = _TOKENS.match(selector, pos)
+        if m is None:
+            raise error()
+        kind = next(k for k in _KINDS if m.group(k) is not None)
+
+        # Combinators end the current compound selector. Only a child
+        # combinator can start a complex selector.
+        if kind in ('comma', 'child', 'space'):
+            if compound:
+                complex_.append((combinator, name, tuple(filters)))
+            elif kind != 'child' or complex_ or combinator == '>':
+                raise error()
+            if kind == 'comma':
+                result.append(complex_)
+                complex_ = []
+            combinator = '>' if kind == 'child' else ' '
+            name, filters, compound = None, [], False
+        elif kind in ('star', 'name'):
+            if compound:
+                raise error()
+            name = m.group('name')
+            compound = True
+        else:
+            value = next((v for v in m.group('dq', 'sq', 'bare') if v is not None), None)
+            filters.append((m.group('attr'), m.group('op'), value))
+            compound = True
+        pos = m.end()
+
+    if not compound:
+        raise error()
+    complex_.append((combinator, name, tuple(filters)))
+    result.append(complex_)
+    return result
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
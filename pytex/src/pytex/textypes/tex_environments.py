@@ -206,6 +206,8 @@ class Tabular(Environment):
 class Verbatim(Environment):
     '''Base class for all verbatim environments'''
 
+    subitem_types = (TeXString,)
+
     def __init__(self, data='', **kwds):
         super(Verbatim, self).__init__(**kwds)
         self.add(TeXString(data))
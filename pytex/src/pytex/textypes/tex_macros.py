@@ -10,6 +10,8 @@ class Verb(Command):
     '''Base class for all verbatim \verb-like commands.'''
 
     argspec = '{data:str}'
+    subitem_types = (TeXString,)
+
     def __init__(self, data):
         super(Verb, self).__init__()
         if data[0] != data [-1]:
@@ -1,9 +1,17 @@
 if __name__ == '__main__':
     import pytex; __package__ = 'pytex'  # @ReservedAssignment @UnusedImport
 
+import re
 import string
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import abc
+from itertools import accumulate
+from contextlib import contextmanager
 from .types.abc import RFile
+from .types.streams import StreamSource
 from .errors import InvalidCharError, MissingTokenError, LaTeXEOFError
 
 #===============================================================================
@@ -59,6 +67,158 @@ DEFAULT_CATEGORIES = [
 VERBATIM_CATEGORIES = [''] * 16
 VERBATIM_CATEGORIES[11] = string.ascii_letters
 
+#===============================================================================
+# Compiled catcode tables
+#===============================================================================
+class CatcodeTable:
+    r'''A compiled mapping from characters to category codes.
+
+    Lookups are constant time: characters in the ASCII/Latin-1 range are
+    stored in a dense 256-byte array and all other characters live in a sparse
+    dictionary. Characters that were never assigned fall back to the `default`
+    catcode (CC_OTHER).
+
+    Tables are mutable, hence primitives such as \catcode can change the
+    category of a character while a Tokenizer that uses the table is running.
+
+    Examples
+    --------
+
+    >>> table = CatcodeTable()
+    >>> table['a'], table['\\'], table['1'], table['\u03b1']
+    (11, 0, 12, 12)
+
+    Category codes can be changed at runtime
+
+    >>> table['\u03b1'] = CC_LETTER
+    >>> table['@'] = CC_OTHER
+    >>> table['\u03b1'], table['@']
+    (11, 12)
+
+    Or a whole list of categories can be loaded at once
+
+    >>> table.load(VERBATIM_CATEGORIES)
+    >>> table['\\'], table['a']
+    (12, 11)
+    '''
+
+    __slots__ = ['_dense', '_sparse', 'default', '_run_regex', '_space_map']
+
+    def __init__(self, categories=DEFAULT_CATEGORIES, default=CC_OTHER):
+        self.default = default
+        self.load(categories)
+
+    def load(self, categories):
+        '''Reset table and assign catcodes from a list of 16 strings, where
+        the i-th string holds all characters of catcode i.'''
+
+        self._run_regex = None
+        if isinstance(categories, CatcodeTable):
+            self._dense = bytearray(categories._dense)
+            self._sparse = dict(categories._sparse)
+            self.default = categories.default
+            return
+
+        self._dense = bytearray([self.default]) * 256
+        self._sparse = {}
+        for code, chars in enumerate(categories):
+            for char in chars:
+                self[char] = code
+
+    def copy(self):
+        '''Return an independent copy of the table'''
+
+        new = CatcodeTable.__new__(CatcodeTable)
+        new._dense = bytearray(self._dense)
+        new._sparse = dict(self._sparse)
+        new.default = self.default
+        new._run_regex = self._run_regex
+        new._space_map = getattr(self, '_space_map', None)
+        return new
+
+    def __getitem__(self, char):
+        try:
+            return self._dense[ord(char)]
+        except IndexError:
+            return self._sparse.get(char, self.default)
+
+    def __setitem__(self, char, code):
+        if not 0 <= code <= 15:
+            raise ValueError('invalid catcode: %r' % code)
+        self._run_regex = None
+        num = ord(char)
+        if num < 256:
+            self._dense[num] = code
+        elif code == self.default:
+            self._sparse.pop(char, None)
+        else:
+            self._sparse[char] = code
+
+    def __eq__(self, other):
+        if isinstance(other, CatcodeTable):
+            return (self._dense == other._dense and
+                    self._sparse == other._sparse and
+                    self.default == other.default)
+        return NotImplemented
+
+    __hash__ = None
+
+    def categories(self):
+        '''Return a list of 16 strings in the same format as
+        DEFAULT_CATEGORIES. Characters with the default catcode are omitted.'''
+
+        data = [[] for _ in range(16)]
+        for num, code in enumerate(self._dense):
+            if code != self.default:
+                data[code].append(chr(num))
+        for char, code in self._sparse.items():
+            data[code].append(char)
+        return [ ''.join(chars) for chars in data ]
+
+    def text_run(self, source, pos):
+        '''Return the end position of the text run that starts at source[pos].
+
+        A text run is a sequence of letter and other characters (catcodes 11
+        and 12) separated by single space characters (catcode 10). It may end 
+        with a single space, but never with two of them: TeX would skip the 
+        second one.'''
+
+        if self._run_regex is None:
+            self._compile_run_regex()
+        if isinstance(source, str):
+            return self._run_regex.match(source, pos).end()
+        return source.match_end(self._run_regex, pos)
+
+    def normalize_spaces(self, text):
+        '''Convert all space characters in text to " ", as TeX does'''
+
+        if self._run_regex is None:
+            self._compile_run_regex()
+        return text.translate(self._space_map)
+
+    def _compile_run_regex(self):
+        text_codes = (CC_LETTER, CC_OTHER)
+        spaces = []
+        stops = []
+        chars = [ (chr(num), code) for num, code in enumerate(self._dense) ]
+        for char, code in chars + list(self._sparse.items()):
+            if code == CC_SPACE:
+                spaces.append(char)
+            if (code in text_codes) != (self.default in text_codes):
+                stops.append(char)
+
+        neg = '^' if self.default in text_codes else ''
+        text = '[%s%s]' % (neg, re.escape(''.join(stops)))
+        if spaces:
+            space = '[%s]' % re.escape(''.join(spaces))
+            regex = '%s*(?:%s%s+)*%s?' % (text, space, text, space)
+        else:
+            regex = '%s*' % text
+        self._run_regex = re.compile(regex)
+        self._space_map = { ord(c): ' ' for c in spaces }
+
+DEFAULT_CATCODE_TABLE = CatcodeTable(DEFAULT_CATEGORIES)
+
 #===============================================================================
 # Token classes
 #===============================================================================
@@ -95,8 +255,10 @@ class Token(str, metaclass=TokenMeta):
     @classmethod
     def from_code(cls, code, st):
         '''Initialize token choosing the appropriate class from the given 
-        catcode'''
+        catcode. Single character tokens are shared through TOKEN_CACHE.'''
 
+        if len(st) == 1:
+            return TOKEN_CACHE.get(cls._CLASSES[code], st)
         return cls._CLASSES[code](st)
 
 class TkEscape(Token):
@@ -161,6 +323,15 @@ class TkInvalid(Token):
 class TkIgnored(Token):
     catcode = CC_IGNORED
 
+class TkTextRun(Token):
+    '''A run of letter, other and single space characters. 
+    
+    These tokens are only created by tokenizers in text_runs() mode and stand 
+    for the sequence of TkLetter, TkOther and TkSpace tokens that would be
+    produced otherwise.'''
+
+    catcode = CC_OTHER
+
 #===============================================================================
 # Extra classes for controlling skipped and extra characters
 #
@@ -189,12 +360,218 @@ class TkSkippedNL(TkSkipped, TkEOL):
     '''Skipped newlines when in STATE_S or STATE_M'''
     catcode = CC_SKIPPED
 
+#===============================================================================
+# Flyweight cache of single character tokens
+#===============================================================================
+class TokenCache:
+    '''A cache of immutable single character tokens.
+    
+    Tokens are str instances that never change after creation. Hence all 
+    occurrences of a given character with a given token type can share the 
+    same object. This saves a lot of allocations (and garbage collection) 
+    in long documents.
+    
+    Tokens are keyed by (token type, character), since the token type 
+    determines the catcode. At most `maxsize` tokens are stored: after that,
+    new tokens are simply created and returned. A `maxsize` of None means no
+    limit.
+    
+    Example
+    -------
+    
+    >>> cache = TokenCache(maxsize=2)
+    >>> cache.get(TkLetter, 'a') is cache.get(TkLetter, 'a')
+    True
+    >>> cache.get(TkOther, 'a')
+    'a'(12)
+    >>> cache.get(TkLetter, 'b') is cache.get(TkLetter, 'b')  # cache is full
+    False
+    '''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._tables = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def table(self, tt):
+        '''Return the dictionary that maps characters to tokens of the given
+        type. Used by the tokenizer to do lookups without method calls'''
+
+        try:
+            return self._tables[tt]
+        except KeyError:
+            return self._tables.setdefault(tt, {})
+
+    def get(self, tt, char):
+        '''Return a token of type tt for the given character'''
+
+        try:
+            return self._tables[tt][char]
+        except KeyError:
+            return self.add(tt, char)
+
+    def add(self, tt, char):
+        '''Create a new token, store it if the cache is not full and return
+        it'''
+
+        tok = tt(char)
+        if self.maxsize is None or self._size < self.maxsize:
+            table = self.table(tt)
+            if char not in table:
+                table[char] = tok
+                self._size += 1
+        return tok
+
+    def clear(self):
+        '''Remove all tokens from cache'''
+
+        self._tables.clear()
+        self._size = 0
+
+TOKEN_CACHE = TokenCache()
+
+#===============================================================================
+# Recorded token streams
+#===============================================================================
+class TokenStream:
+    r'''The complete sequence of tokens produced for a source, together with
+    the position in source after each token.
+    
+    Token streams can be serialized into a compact binary form and replayed 
+    by a Tokenizer without scanning the source again (see Tokenizer.replay()).
+    
+    Example
+    -------
+    
+    >>> stream = TokenStream.record(r'\foo bar')
+    >>> stream.tokens
+    ['\\foo'(0), ' '(16), 'b'(11), 'a'(11), 'r'(11)]
+    >>> list(stream.ends)
+    [4, 5, 6, 7, 8]
+    >>> TokenStream.from_bytes(stream.to_bytes()) == stream
+    True
+    '''
+
+    MAGIC = b'PTXS'
+    VERSION = 1
+
+    # Token types in the order they are stored in binary form
+    TYPES = (TkEscape, TkBGroup, TkEGroup, TkMath, TkAlignment, TkEOL,
+             TkParameter, TkSuper, TkSub, TkIgnored, TkSpace, TkLetter,
+             TkOther, TkActive, TkComment, TkInvalid, TkExtraSpace,
+             TkSkippedWS, TkSkippedNL, TkTextRun)
+
+    def __init__(self, tokens, ends):
+        self.tokens = tokens
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __eq__(self, other):
+        if isinstance(other, TokenStream):
+            return (self.ends == other.ends and
+                    [type(x) for x in self.tokens] == [type(x) for x in other.tokens] and
+                    self.tokens == other.tokens)
+        return NotImplemented
+
+    @classmethod
+    def record(cls, source, catcodes=None):
+        '''Tokenize the given source and return the resulting TokenStream'''
+
+        tokenizer = Tokenizer(source, catcodes)
+        tokens, ends = [], array('q')
+        for tok in tokenizer:
+            tokens.append(tok)
+            ends.append(tokenizer._pos)
+        return cls(tokens, ends)
+
+    def to_bytes(self):
+        '''Serialize token stream.
+        
+        Each distinct token is stored once in a table of token types (one byte
+        each) and strings. The stream itself is an array of indices into this 
+        table and an array with the size of the source slice consumed by each
+        token.'''
+
+        type_codes = {tt: code for code, tt in enumerate(self.TYPES)}
+        table, codes, lengths, strings = {}, bytearray(), array('I'), []
+        index = array('I')
+        for tok in self.tokens:
+            tt = type(tok)
+            key = (tt, str(tok))
+            try:
+                idx = table[key]
+            except KeyError:
+                idx = table[key] = len(table)
+                data = key[1].encode('utf8', 'surrogatepass')
+                codes.append(type_codes[tt])
+                lengths.append(len(data))
+                strings.append(data)
+            index.append(idx)
+        deltas = array('I', (end - start for start, end
+                             in zip([0] + list(self.ends), self.ends)))
+        text = b''.join(strings)
+
+        arrays = [lengths, index, deltas]
+        if sys.byteorder == 'big':
+            for arr in arrays:
+                arr.byteswap()
+        header = struct.pack('<4sBIII', self.MAGIC, self.VERSION, len(codes),
+                             len(index), len(text))
+        return b''.join([header, bytes(codes)] + [x.tobytes() for x in arrays] + [text])
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Load a token stream serialized by to_bytes(). Raises ValueError if
+        data is not a valid stream'''
+
+        header = struct.Struct('<4sBIII')
+        try:
+            magic, version, n_table, n_tokens, n_text = header.unpack_from(data)
+        except struct.error:
+            raise ValueError('truncated token stream')
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError('not a token stream or unsupported version')
+        if len(data) != header.size + n_table * 5 + n_tokens * 8 + n_text:
+            raise ValueError('corrupted token stream')
+
+        pos = header.size
+        codes = data[pos:pos + n_table]
+        pos += n_table
+        arrays = []
+        for size in [n_table, n_tokens, n_tokens]:
+            arr = array('I')
+            arr.frombytes(data[pos:pos + 4 * size])
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            arrays.append(arr)
+            pos += 4 * size
+        lengths, index, deltas = arrays
+        text = data[pos:]
+
+        # Rebuild the table of tokens. Single character tokens are shared
+        # through TOKEN_CACHE
+        table, start = [], 0
+        types = cls.TYPES
+        for code, size in zip(codes, lengths):
+            tt = types[code]
+            st = text[start:start + size].decode('utf8', 'surrogatepass')
+            start += size
+            table.append(TOKEN_CACHE.get(tt, st) if len(st) == 1 else tt(st))
+
+        tokens = list(map(table.__getitem__, index))
+        return cls(tokens, array('q', accumulate(deltas)))
+
 #===============================================================================
 # Auxiliary tokenizer class. Used by the TeX parser in order to produce tokens
 # from a TeX source code
 #===============================================================================
 class Tokenizer:
-    def __init__(self, source='', catcodes=None):
+    def __init__(self, source='', catcodes=None, token_cache=TOKEN_CACHE):
         r'''Implements the tokenizer phase of TeX processing.
         
         Instances are iterators that yields a sequence of tokens.
@@ -218,14 +595,35 @@ class Tokenizer:
         
         >>> list(tokens)
         [' '(16), 'j'(11), 'o'(11), 'e'(11)]
+        
+        Single character tokens are shared through a TokenCache. Use 
+        token_cache=None in order to always create new token objects.
+        
+        >>> a1, a2 = Tokenizer('aa'); a1 is a2
+        True
+        >>> a1, a2 = Tokenizer('aa', token_cache=None); a1 is a2
+        False
+        
+        Files and mmaps are not read at once, but are tokenized in chunks 
+        through a StreamSource object
+        
+        >>> import io
+        >>> tokens = Tokenizer(io.StringIO(r'hi \you'))
+        >>> list(tokens)
+        ['h'(11), 'i'(11), ' '(10), '\\you'(0)]
         '''
 
-        self._catcode_table = catcodes or DEFAULT_CATEGORIES
+        if isinstance(catcodes, CatcodeTable):
+            self._catcode_table = catcodes
+        elif catcodes is None:
+            self._catcode_table = DEFAULT_CATCODE_TABLE.copy()
+        else:
+            self._catcode_table = CatcodeTable(catcodes)
         self._tk_buffer = []
         self._tokens = self._itertokens_()
         if isinstance(source, RFile):
-            source = source.read()
-        elif isinstance(source, str):
+            source = StreamSource(source)
+        elif isinstance(source, (str, StreamSource)):
             pass
         elif isinstance(source, (tuple, list, abc.Iterable)):
             self._tk_buffer.extend(source)
@@ -235,6 +633,13 @@ class Tokenizer:
         self._source = source
         self._pos = 0
         self._lineno = 0
+        self._text_runs = False
+        self._line_starts = None
+        if token_cache is None:
+            token_cache = TokenCache(maxsize=0)
+        self._token_cache = token_cache
+        self._replay = None
+        self._replay_count = 0
 
     def _itertokens_(self):
         """A iterator over raw tokens extracted from a TeX source. 
@@ -244,10 +649,18 @@ class Tokenizer:
 
         # Local variables
         tk_buffer = self._tk_buffer
-        catcoder = self.get_catcode
-        read_next = self.read_char
+        catcodes = self._catcode_table
+        catcoder = catcodes.__getitem__
+        read_next = self._read_source_
         iter_chars = self._iter_source_
 
+        # Flyweight tokens
+        cache = self._token_cache
+        letters = cache.table(TkLetter)
+        others = cache.table(TkOther)
+        spaces = cache.table(TkSpace)
+        new_token = cache.add
+
         # Define tokenizer state
         STATE_S = 1  # skipping spaces
         STATE_M = 2  # middle of line
@@ -288,13 +701,26 @@ class Tokenizer:
             # between (S)kipping spaces, (M)iddle of the line or (N)ew line.
 
             # Test letter and other first since they are the most common
-            if code == CC_LETTER:
+            if (code == CC_LETTER or code == CC_OTHER) and self._text_runs:
+                # Absorb the whole run of text in a single token. A run only
+                # ends in a space if the next character would be skipped
+                source, pos = self._source, self._pos
+                end = catcodes.text_run(source, pos)
+                self._pos = end
+                if end > pos and catcoder(source[end - 1]) == CC_SPACE:
+                    state = STATE_S
+                else:
+                    state = STATE_M
+                data = catcodes.normalize_spaces(source[pos:end])
+                yield TkTextRun(token + data)
+
+            elif code == CC_LETTER:
                 state = STATE_M
-                yield TkLetter(token)
+                yield letters.get(token) or new_token(TkLetter, token)
 
             elif code == CC_OTHER:
                 state = STATE_M
-                yield TkOther(token)
+                yield others.get(token) or new_token(TkOther, token)
 
             # TkEscape sequence
             elif code == CC_ESCAPE:
@@ -330,12 +756,12 @@ class Tokenizer:
                     # We also want to keep track of skipped newlines, hence we
                     # yield both of these tokens
                     state = STATE_N
-                    yield TkExtraSpace(' ')
-                    yield TkSkippedNL(token)
+                    yield cache.get(TkExtraSpace, ' ')
+                    yield cache.get(TkSkippedNL, token)
                     continue
                 else:
                     state = STATE_N
-                    yield TkSkippedNL(token)
+                    yield cache.get(TkSkippedNL, token)
 
             # Parameters such as #1, #2, etc and ##
             elif code == CC_PARAMETER:
@@ -350,11 +776,12 @@ class Tokenizer:
             elif code == CC_SPACE:
                 if state == STATE_M:
                     state = STATE_S
-                    yield TkSpace(' ')  # TeX converts all catcode=CC_SPACE into
-                                        # character code 32 (' ') regardless if
-                                        # they were tabs or other space character.
+                    # TeX converts all catcode=CC_SPACE into character code 
+                    # 32 (' ') regardless if they were tabs or other space 
+                    # character.
+                    yield spaces.get(' ') or new_token(TkSpace, ' ')
                 else:
-                    yield TkSkippedWS(token)
+                    yield cache.get(TkSkippedWS, token)
 
             # Comments
             elif code == CC_COMMENT:
@@ -371,17 +798,100 @@ class Tokenizer:
 
             # Ignored characters are simply ignored
             elif code == CC_IGNORED:
-                yield TkIgnored(token)
+                yield cache.get(TkIgnored, token)
 
             # All other characters are passed direclty and change the state to
             # middle-of-the-line
             else:
                 state = STATE_M
-                yield Token.from_code(code, token)
+                yield cache.get(Token._CLASSES[code], token)
+
+    def replay(self, stream):
+        r'''Read tokens from a TokenStream recorded for the same source and 
+        catcodes instead of scanning the source. 
+        
+        The tokenizer switches back to scanning the source if a method that 
+        reads characters directly (such as read_verbatim()) is called or if 
+        catcodes are changed.
+        
+        Example
+        -------
+        
+        >>> source = r'\foo{bar}'
+        >>> tokens = Tokenizer(source)
+        >>> tokens.replay(TokenStream.record(source))
+        >>> tokens.get_next(), tokens.get_next(), tokens.read_verbatim('}')
+        ('\\foo'(0), '{'(1), 'bar')
+        '''
+
+        self._replay = stream
+        self._replay_count = 0
+        self._tokens = self._replay_tokens_()
+
+    def _replay_tokens_(self):
+        tk_buffer = self._tk_buffer
+        source, catcodes = self._source, self._catcode_table
+        tokens, ends = self._replay.tokens, self._replay.ends
+        extra_space = False
+        idx = self._replay_count
+        size = len(tokens)
+        while idx < size:
+            tok = tokens[idx]
+
+            # _itertokens_() yields a TkExtraSpace and the following newline
+            # without looking at the buffer in between
+            if not (extra_space and type(tok) is TkSkippedNL):
+                while tk_buffer:
+                    yield tk_buffer.pop()
+            extra_space = type(tok) is TkExtraSpace
+
+            # Merge the recorded tokens of a run of text, exactly as 
+            # _itertokens_() does in text run mode
+            if self._text_runs and (type(tok) is TkLetter or type(tok) is TkOther):
+                pos = ends[idx]
+                end = catcodes.text_run(source, pos)
+                tok = TkTextRun(tok + catcodes.normalize_spaces(source[pos:end]))
+                idx = bisect_left(ends, end, idx)
+
+            self._pos = ends[idx]
+            idx += 1
+            self._replay_count = idx
+            yield tok
+
+        # Scanning the remaining source only yields a None at EOF
+        self._replay = None
+        yield from self._itertokens_()
+
+    def _stop_replay(self):
+        '''Switch from replaying a token stream to scanning the source.
+        
+        The state of the scanner depends on all characters read so far, hence
+        the source is scanned again from the beginning up to the current 
+        position.'''
+
+        if self._replay is None:
+            return
+        count, pos, text_runs = self._replay_count, self._pos, self._text_runs
+        pending = self._tk_buffer[:]
+        del self._tk_buffer[:]
+        self._replay = None
+        self._pos = 0
+        self._text_runs = False
+        tokens = self._itertokens_()
+        for _ in range(count):
+            next(tokens)
+        assert self._pos == pos, 'token stream does not match source'
+        self._tk_buffer[:] = pending
+        self._text_runs = text_runs
+        self._tokens = tokens
 
     def read_char(self, size=1):
         '''Read the next character in the token stream'''
 
+        self._stop_replay()
+        return self._read_source_(size)
+
+    def _read_source_(self, size=1):
         if self._tk_buffer:
             raise NotImplementedError
         try:
@@ -464,6 +974,8 @@ class Tokenizer:
         'bar'
         '''
 
+        self._stop_replay()
+
         # Use tokens in buffer
         tokens = self._tk_buffer
         buffer = ''.join(reversed(tokens))
@@ -473,8 +985,9 @@ class Tokenizer:
             return buffer + stop_char
 
         if not stop_char:
-            self._pos = len(self._source)
-            return buffer + self._source[self._pos:]
+            data = self._source[self._pos:]
+            self._pos += len(data)
+            return buffer + data
 
         # Check if stop char is partially in buffer and correct source
         partials = [ stop_char[:-i] for i in range(1, len(stop_char)) ]
@@ -552,11 +1065,14 @@ class Tokenizer:
     def get_catcode(self, char):
         """Return the integer character code that `char` belongs to."""
 
-        for no, chars in enumerate(self._catcode_table):
-            if char in chars:
-                return no
-        else:
-            return CC_OTHER
+        return self._catcode_table[char]
+
+    def set_catcode(self, char, code):
+        """Change the catcode of `char`. The change affects all characters 
+        that were not tokenized yet."""
+
+        self._stop_replay()
+        self._catcode_table[char] = code
 
     def all_tokens(self):
         '''A debugging function: it return a list of tokens and push all of them
@@ -569,25 +1085,74 @@ class Tokenizer:
     def get_lineno(self):
         '''Return the probable line number for the next character.'''
 
-        return self._source.count('\n', 0, self._pos)
+        return self.position()[0]
 
     def get_line(self, idx=None):
-        '''Return idx-th line of source code.'''
-
-        lines = self._source.splitlines()
-        idx = idx if idx is not None else self._pos
-        if len(lines) == idx:
-            return '<EOL>'
-        else:
-            return lines[idx]
+        '''Return idx-th line of source code (defaults to the current line).'''
+
+        starts = self.line_starts()
+        if idx is None:
+            idx = self.get_lineno()
+        idx -= self._first_line()
+        if idx < 0:
+            raise ValueError('source line was discarded')
+        start = starts[idx]
+        if idx + 1 < len(starts):
+            return self._source[start:starts[idx + 1] - 1]
+        end = self._source.find('\n', start)
+        line = self._source[start:end] if end != -1 else self._source[start:]
+        return line or '<EOL>'
 
     def get_charno(self):
         '''Return the proable position of the cursor on the current line.'''
 
-        pos = self._pos
-        for line in self._source.splitlines()[:self._lineno]:
-            pos -= len(line)
-        return pos
+        return self.position()[1]
+
+    def position(self, pos=None):
+        r'''Return a (line, column) tuple for the given position in source
+        (defaults to the current position). Lines and columns are counted from 
+        zero.
+        
+        Lookups use a bisection on the offsets in line_starts(), hence they 
+        are cheap even for long documents. Positions in the lines that a file
+        source has discarded raise a ValueError.
+        
+        Example
+        -------
+        
+        >>> tokens = Tokenizer('foo\nbar\n\\ham')
+        >>> tokens.position(0), tokens.position(5), tokens.position(8)
+        ((0, 0), (1, 1), (2, 0))
+        '''
+
+        if pos is None:
+            pos = self._pos
+        starts = self.line_starts()
+        lineno = bisect_right(starts, pos) - 1
+        if lineno < 0:
+            raise ValueError('source data before position %s was discarded' % starts[0])
+        return (lineno + self._first_line(), pos - starts[lineno])
+
+    def line_starts(self):
+        '''Return an array with the offset of the first character of each 
+        line in the source. 
+        
+        The index is computed lazily on the first call. For file sources, it 
+        grows as new chunks of data are read and only holds the lines from 
+        _first_line() on.'''
+
+        if isinstance(self._source, StreamSource):
+            return self._source.line_starts
+        if self._line_starts is None:
+            starts = array('q', [0])
+            starts.extend(m.end() for m in re.finditer('\n', self._source))
+            self._line_starts = starts
+        return self._line_starts
+
+    def _first_line(self):
+        '''Return the number of the line that starts at line_starts()[0]'''
+
+        return getattr(self._source, 'first_line', 0)
 
     def tell_next(self):
         '''Tell what is the next token'''
@@ -607,6 +1172,41 @@ class Tokenizer:
         while nxt is not None and nxt.catcode in (CC_SPACE, CC_EOL):
             next(self)
 
+    @contextmanager
+    def text_runs(self):
+        r'''Context manager that enables the text run mode.
+        
+        Inside the with block, runs of letters, other characters and spaces
+        are returned as a single TkTextRun token rather than as one token per 
+        character. Returns False and does nothing if the tokenizer must 
+        inspect characters individually.
+        
+        Example
+        -------
+        
+        >>> tokens = Tokenizer(r'Some text,  \foo bar')
+        >>> with tokens.text_runs():
+        ...     list(tokens)
+        ['Some text, '(12), ' '(16), '\\foo'(0), ' '(16), 'bar'(12)]
+        '''
+
+        if not self._text_runs_safe:
+            yield False
+            return
+
+        old = self._text_runs
+        self._text_runs = True
+        try:
+            yield True
+        finally:
+            self._text_runs = old
+
+    _text_runs_safe = True
+
+    # Enclosing readers whose stop conditions must be checked by the sub
+    # tokenizers created from this tokenizer. The root has none.
+    _stops = ()
+
     #===========================================================================
     # Special iterators
     #===========================================================================
@@ -626,14 +1226,20 @@ class Tokenizer:
         Token can be a token or string object for testing by value or a token 
         class for testing by type'''
 
-        if isinstance(token, (str, Token)):
+        if isinstance(token, Token):
+            func = lambda x: x != token
+            stop_types = (type(token),)
+        elif isinstance(token, str):
             func = lambda x: x != token
+            stop_types = (Token,)
         elif isinstance(token, (type, tuple)):
             func = lambda x: not isinstance(x, token)
+            stop_types = token if isinstance(token, tuple) else (token,)
         else:
             raise TypeError(type(token))
 
-        return TakeWhileTokenizer(self, func)
+        return TakeWhileTokenizer(self, func, _is_text_blind(token),
+                                  stop_key=token, stop_types=stop_types)
 
     def stopping_before_macro(self, macro_name):
         '''Stops iteration just before the given macro appears in the token 
@@ -642,7 +1248,9 @@ class Tokenizer:
         def func(x):
             return not isinstance(x, TkEscape) or x.macro_name != macro_name
 
-        return TakeWhileTokenizer(self, func)
+        return TakeWhileTokenizer(self, func, text_runs_safe=True,
+                                  stop_key=TkEscape('\\' + macro_name),
+                                  stop_types=(TkEscape,))
 
     def while_equals(self, token):
         '''Iterate while tokens are equal to the given token.
@@ -675,17 +1283,81 @@ class Tokenizer:
     #===========================================================================
     @property
     def source(self):
+        '''The source string or a StreamSource for file inputs'''
+
         return self._source
 
+    @property
+    def root(self):
+        '''The root tokenizer that reads tokens from source'''
+
+        return self
+
+    @property
+    def catcodes(self):
+        '''The CatcodeTable used by the tokenizer. It can be modified in place
+        or replaced by a list of categories or by another table.'''
+
+        return self._catcode_table
+
+    @catcodes.setter
+    def catcodes(self, value):
+        self._stop_replay()
+        self._catcode_table.load(value)
+
 class SubTokenizer(Tokenizer):
-    '''A derived Tokenizer that can override the __next__ method'''
+    r'''A derived Tokenizer that can override the __next__ method.
+    
+    Sub tokenizers never wrap each other: they all read directly from the root
+    Tokenizer, which acts as a single cursor over the token stream. Only the 
+    stop condition of the innermost reader, i.e., the sub tokenizer that is 
+    being iterated, is checked for every token. Each reader also keeps the 
+    stack of enclosing stop conditions, which is checked only for tokens of the
+    types that may trigger them. Conditions that are equal to an inner one are 
+    dropped from the stack, since the inner reader always stops first. Reading
+    a token hence costs the same regardless of how deeply the readers are 
+    nested.
+    
+    A token that stops an enclosing reader is a syntax error
+    
+    >>> from pytex import TeXJob
+    >>> def read(src):
+    ...     try:
+    ...         TeXJob(src).parse()
+    ...     except MissingTokenError as ex:
+    ...         print(ex.msg.splitlines()[:2])
+    >>> read(r'{ a \begin{center} b } \end{center}')
+    ['error around line 1, char 23', "I was expecting '\\\\endcenter'(0), but got '}'(2)<class 'pytex.tokens.TkEGroup'>"]
+    >>> read(r'\begin{center} { a \end{center} }')
+    ['error around line 1, char 32', "I was expecting <class 'pytex.tokens.TkEGroup'>, but got '\\\\endcenter'(0)<class 'pytex.tokens.TkEscape'>"]
+    >>> read(r'$ a { b $ c }')
+    ['error around line 1, char 10', "I was expecting <class 'pytex.tokens.TkEGroup'>, but got '$'(3)<class 'pytex.tokens.TkMath'>"]
+    '''
+
+    # The value of the stop condition (used to compare conditions) and the
+    # token types that may trigger it
+    stop_key = None
+    stop_types = ()
 
     def __init__(self, tokenizer):
+        key = self.stop_key
+        outer = tokenizer._stops
+        if key is not None:
+            outer = tuple(x for x in outer if x.stop_key != key)
+        self._outer = outer
+        self._outer_types = tuple({tt for x in outer for tt in x.stop_types})
+        self._outer_text_safe = all(x.text_runs_safe for x in outer)
+        self._stops = (self,) + outer if self.stop_types else outer
+
+        tokenizer = tokenizer.root
         self._tokenizer = tokenizer
         self._source = tokenizer._source
         self._catcode_table = tokenizer._catcode_table
         self._tk_buffer = tokenizer._tk_buffer
-        self._tokens = tokenizer._tokens
+
+    @property
+    def _tokens(self):
+        return self._tokenizer._tokens
 
     @property
     def _pos(self):
@@ -703,34 +1375,89 @@ class SubTokenizer(Tokenizer):
     def _lineno(self, value):
         self._tokenizer._lineno = value
 
+    def line_starts(self):
+        return self._tokenizer.line_starts()
+
+    @property
+    def _text_runs(self):
+        return self._tokenizer._text_runs
+
+    @_text_runs.setter
+    def _text_runs(self, value):
+        self._tokenizer._text_runs = value
+
+    @property
+    def _text_runs_safe(self):
+        return self.text_runs_safe and self._outer_text_safe
+
+    def _stop_replay(self):
+        self._tokenizer._stop_replay()
+
+    def _check_outer(self, tok):
+        '''Raise a MissingTokenError if tok stops an enclosing reader'''
+
+        for reader in self._outer:
+            if reader.stops_at(tok):
+                self._tokenizer.push(tok)
+                raise MissingTokenError(tok, self.stop_key, self)
+
+    def stops_at(self, tok):
+        '''Return True if the reader stops at the given token'''
+
+        return False
+
+    @property
+    def root(self):
+        return self._tokenizer
+
+    # Sub tokenizers that count or compare tokens by value must see each 
+    # character separately
+    text_runs_safe = False
 
 class TakeWhileTokenizer(SubTokenizer):
     '''A truncated Tokenizer. It iterates while cond_func(token) returns True.'''
 
-    def __init__(self, tokenizer, cond_func=(lambda x: True)):
-        super(TakeWhileTokenizer, self).__init__(tokenizer)
+    def __init__(self, tokenizer, cond_func=(lambda x: True), text_runs_safe=False,
+                 stop_key=None, stop_types=(Token,)):
         self.cond_func = cond_func
+        self.text_runs_safe = text_runs_safe
+        self.stop_key = stop_key
+        self.stop_types = stop_types
+        super(TakeWhileTokenizer, self).__init__(tokenizer)
 
     def __next__(self):
         tok = next(self._tokenizer)
         if not self.cond_func(tok):
             self._tokenizer.push(tok)
             raise StopIteration
+        if isinstance(tok, self._outer_types):
+            self._check_outer(tok)
         return tok
 
+    def stops_at(self, tok):
+        return not self.cond_func(tok)
+
 class SizedTokenizer(SubTokenizer):
-    '''A truncated Tokenizer. It stops iteration after maxsize items are yielded.'''
+    '''A truncated Tokenizer. It stops iteration after maxsize items are yielded.
+    
+    Tokens are read from the wrapped tokenizer, hence its stop condition still
+    applies
+    
+    >>> tokens = Tokenizer('ab}cd').stopping_before(TkEGroup).sized(5)
+    >>> list(tokens), list(tokens.root)
+    (['a'(11), 'b'(11)], ['}'(2), 'c'(11), 'd'(11)])
+    '''
 
     def __init__(self, tokenizer, maxsize):
         super(SizedTokenizer, self).__init__(tokenizer)
-        self._tokenizer = tokenizer
+        self._wrapped = tokenizer
         self.maxsize = maxsize
         self._n_iter = 0
 
     def __next__(self):
         if self._n_iter < self.maxsize:
             self._n_iter += 1
-            return next(self._tokenizer)
+            return next(self._wrapped)
         self._n_iter = 0
         raise StopIteration
 
@@ -738,6 +1465,10 @@ class EGroupTokenizer(SubTokenizer):
     '''Iterates until a group closes. It matches opening and closing characters
     to avoid an early stop.'''
 
+    text_runs_safe = True
+    stop_key = TkEGroup
+    stop_types = (TkEGroup,)
+
     def __init__(self, tokenizer):
         super(EGroupTokenizer, self).__init__(tokenizer)
         self._count = 0
@@ -747,9 +1478,12 @@ class EGroupTokenizer(SubTokenizer):
         try:
             tok = next(self._tokenizer)
         except StopIteration:
-            print('-' * 80)
-            print(self.source[self._bpos:])
-            raise EOFError(r'tokens ended before expected "}"')
+            try:
+                lineno, charno = self.position(self._bpos)
+            except ValueError:
+                raise EOFError('tokens ended before expected "}"')
+            msg = 'tokens ended before expected "}" (group opened at line %s, char %s)'
+            raise EOFError(msg % (lineno + 1, charno + 1))
 
         # update idx var
         if isinstance(tok, TkEGroup):
@@ -762,8 +1496,27 @@ class EGroupTokenizer(SubTokenizer):
             self._tokenizer.push(tok)
             self._count = 0
             raise StopIteration
+        if isinstance(tok, self._outer_types):
+            self._check_outer(tok)
         return tok
 
+    def stops_at(self, tok):
+        return isinstance(tok, TkEGroup) and self._count >= 0
+
+def _is_text_blind(token):
+    '''Return True if a stop condition on the given token value or type can
+    never be triggered by a text character.'''
+
+    text_types = (TkLetter, TkOther, TkSpace, TkTextRun)
+    if isinstance(token, Token):
+        return not isinstance(token, text_types)
+    elif isinstance(token, type):
+        token = (token,)
+    elif isinstance(token, str):
+        return False
+    return all(not issubclass(tt, text_types) and not issubclass(TkTextRun, tt)
+               for tt in token)
+
 #===============================================================================
 # Testing code
 #===============================================================================
@@ -1,4 +1,6 @@
 import abc
+import io
+import mmap
 
 class RFile(abc.ABC):
     '''Defines a minimal read-only file interface in order to check if an 
@@ -16,3 +18,6 @@ class RFile(abc.ABC):
     @abc.abstractmethod
     def seek(self, pos):
         pass
+
+RFile.register(io.IOBase)
+RFile.register(mmap.mmap)
@@ -5,6 +5,8 @@ This module contains all metatypes used by TeXElements subclasses.
 if __name__ == '__main__':
     import pytex; __package__ = 'pytex.types'  # @UnusedImport @ReservedAssignment
 
+import copyreg
+import sys
 from .argspec import Argspec
 
 #===============================================================================
@@ -126,6 +128,14 @@ class MacroMeta(BaseMeta):
 
     varname = 'macro_name'
 
+    def __new__(cls, name, bases, ns):
+        # Macros store their data in the args slot. Old style definitions that
+        # declare args as a class attribute hide the slot: these classes keep
+        # an instance __dict__ to store the arguments.
+        if 'args' not in ns:
+            ns.setdefault('__slots__', ())
+        return super(MacroMeta, cls).__new__(cls, name, bases, ns)
+
     @staticmethod
     def make_name(new, varname, name):
         BaseMeta.make_name(new, varname, name)
@@ -157,3 +167,39 @@ class EnvironmentMeta(BaseMeta):
 
         cls.begin_macro = begin
         cls.end_macro = end
+
+#===============================================================================
+# Pickle support. Many macro and environment classes are created at runtime
+# (unknown macros, the \begin/\end macros of environments, commands defined 
+# in package templates, etc) and cannot be pickled by reference. These classes
+# are recreated from their name, bases and argspec when unpickled. Recreated
+# classes are cached, so equivalent classes from different pickles are shared.
+#===============================================================================
+def _reduce_class(cls):
+    obj = sys.modules.get(cls.__module__)
+    for attr in cls.__qualname__.split('.'):
+        obj = getattr(obj, attr, None)
+    if obj is cls:
+        return cls.__qualname__
+
+    # Begin/end macros are recreated with their environment
+    env = cls.__dict__.get('environment')
+    if env is not None:
+        attr = 'begin_macro' if env.begin_macro is cls else 'end_macro'
+        return (getattr, (env, attr))
+
+    ns = {k: v for (k, v) in cls.__dict__.items() if k in _CLASS_ATTRS}
+    ns['argspec'] = cls.argspec._declaration
+    return (_rebuild_class, (type(cls), cls.__name__, cls.__bases__, ns))
+
+def _rebuild_class(metatype, name, bases, ns):
+    key = (metatype, name, bases, tuple(sorted(ns.items())))
+    try:
+        return _REBUILT_CLASSES[key]
+    except KeyError:
+        return _REBUILT_CLASSES.setdefault(key, metatype(name, bases, ns))
+
+_CLASS_ATTRS = {'name', 'macro_name', 'env_name', 'is_abstract'}
+_REBUILT_CLASSES = {}
+copyreg.pickle(MacroMeta, _reduce_class)
+copyreg.pickle(EnvironmentMeta, _reduce_class)
@@ -1,5 +1,10 @@
 from collections import MutableMapping
 
+# Markers for keys that are not found and for keys that were deleted in a 
+# fork but are still present in the shared layers
+_MISSING = object()
+_DELETED = object()
+
 class NestedDict(MutableMapping):
     '''Represent nested mappings.
     
@@ -34,51 +39,185 @@ class NestedDict(MutableMapping):
     Traceback (most recent call last):
     ...
     ValueError: already in the lowest level of dictionary
+    
+    Deleting a key removes it from the highest level that defines it and 
+    uncovers the value shadowed in the lower levels
+    
+    >>> ns.up(); ns['foo'] = 2; del ns['foo']; ns
+    NestedDict({'foo': 1})
+    
+    Forks share data until one of them is modified. Each fork only records 
+    the keys that it writes
+    
+    >>> fork = ns.fork(); fork['bar'] = 2
+    >>> fork, ns
+    (NestedDict({'foo': 1, 'bar': 2}), NestedDict({'foo': 1}))
+    >>> fork._data, fork._layers
+    ({'bar': 2}, ({'foo': 1},))
+    >>> del fork['foo']; fork, ns
+    (NestedDict({'bar': 2}), NestedDict({'foo': 1}))
+    
+    Implementation
+    --------------
+    
+    All visible keys are stored in a single flat dictionary. Each level keeps
+    an undo log mapping the keys that it defines to their previous value, 
+    wrapped in a 1-tuple, or to an empty tuple if the key was not present. 
+    Lookups and up() are O(1) and down() is linear on the number of keys 
+    defined in the discarded level.
+    
+    fork() turns the flat dictionary into a read-only layer shared by both
+    copies, which then write to new private dictionaries. Keys deleted from
+    a private dictionary are marked as such in order to hide the shared 
+    layers. Lookups check at most MAX_LAYERS + 1 dictionaries: the layers 
+    above the bottom one, which usually holds most keys, are merged when 
+    there are too many of them.
     '''
 
+    MAX_LAYERS = 8
+
     def __init__(self, data=None, **kwds):
-        self._data = [{}]
-        self.update(data or {})
-        self.update(kwds)
+        # There is no undo log in the lowest level, hence data can be copied
+        # directly
+        self._data = dict(data or {}, **kwds)
+        self._layers = ()
+        self._undo = []
+        self._shared_undo = 0
+
+    def fork(self):
+        '''Return a copy of the dictionary.
+        
+        The cost of a fork does not depend on the number of keys: only the 
+        list of undo logs is copied. Logs created before the fork are 
+        shared and copied before they are modified.'''
+
+        if self._data:
+            layers = (self._data,) + self._layers
+            if len(layers) > self.MAX_LAYERS:
+                top = {}
+                for layer in reversed(layers[:-1]):
+                    top.update(layer)
+                layers = (top, layers[-1])
+            self._layers = layers
+            self._data = {}
+
+        new = object.__new__(type(self))
+        new._data = {}
+        new._layers = self._layers
+        new._undo = list(self._undo)
+        new._shared_undo = self._shared_undo = len(self._undo)
+        return new
+
+    def _lookup(self, key):
+        '''Return the value of key or _MISSING'''
+
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            for layer in self._layers:
+                value = layer.get(key, _MISSING)
+                if value is not _MISSING:
+                    break
+        return _MISSING if value is _DELETED else value
+
+    def _restore(self, key, old):
+        '''Restore the value saved in an undo log'''
+
+        if old:
+            self._data[key] = old[0]
+        elif self._layers:
+            self._data.pop(key, None)
+            if self._lookup(key) is not _MISSING:
+                self._data[key] = _DELETED
+        else:
+            del self._data[key]
+
+    def _log(self, idx):
+        '''Return the idx-th undo log, copying the logs that are shared with
+        forks before it is modified'''
+
+        undo = self._undo
+        if idx < 0:
+            idx += len(undo)
+        for i in range(idx, self._shared_undo):
+            undo[i] = dict(undo[i])
+        self._shared_undo = min(idx, self._shared_undo)
+        return undo[idx]
 
     def up(self, dic=None):
         '''Create a new level in the namespace object'''
-        self._data.append(dic if dic is not None else {})
+        self._undo.append({})
+        if dic:
+            self.update(dic)
 
     def down(self):
         '''Discard the last level in the namespace object'''
-        if len(self._data) == 1:
+        if not self._undo:
             raise ValueError('already in the lowest level of dictionary')
-        self._data.pop()
+        log = self._undo.pop()
+        self._shared_undo = min(self._shared_undo, len(self._undo))
+        for key, old in log.items():
+            self._restore(key, old)
 
     def __delitem__(self, key):
-        for d in reversed(self._data):
-            if key in d:
-                del d[key]
+        for idx in range(len(self._undo) - 1, -1, -1):
+            if key in self._undo[idx]:
+                self._restore(key, self._log(idx).pop(key))
                 break
         else:
-            raise KeyError(key)
+            if self._lookup(key) is _MISSING:
+                raise KeyError(key)
+            self._restore(key, ())
 
     def __getitem__(self, key):
-        for d in reversed(self._data):
-            if key in d:
-                return d[key]
+        # Inlined _lookup(): this is the hot path of macro lookups. The bottom
+        # layer never holds deleted keys.
+        data = self._data
+        if key in data:
+            value = data[key]
+            if value is not _DELETED:
+                return value
+        elif len(self._layers) == 1:
+            return self._layers[0][key]
         else:
-            raise KeyError(key)
+            value = self._lookup(key)
+            if value is not _MISSING:
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
 
     def __iter__(self):
-        used = {...}
-        for d in self._data:
-            for k in d:
-                if k not in used:
-                    used.add(k)
-                    yield k
+        if not self._layers:
+            return iter(self._data)
+        return self._iter_layers()
+
+    def _iter_layers(self):
+        # Keys are listed from the bottom layer up, in insertion order
+        seen = set()
+        for layer in reversed((self._data,) + self._layers):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    if self._lookup(key) is not _MISSING:
+                        yield key
 
     def __len__(self):
-        return sum(1 for _ in self)
+        if not self._layers:
+            return len(self._data)
+        return sum(1 for _ in self._iter_layers())
 
     def __setitem__(self, key, value):
-        self._data[-1][key] = value
+        if self._undo:
+            log = self._log(-1)
+            if key not in log:
+                old = self._lookup(key)
+                log[key] = () if old is _MISSING else (old,)
+        self._data[key] = value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
 
     def __repr__(self):
         data = ', '.join('%r: %r' % item for item in self.items())
@@ -86,4 +225,4 @@ class NestedDict(MutableMapping):
 
 if __name__ == '__main__':
     import doctest
-    doctest.testmod()
\ No newline at end of file
+    doctest.testmod()
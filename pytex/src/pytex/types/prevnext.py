@@ -3,6 +3,7 @@ used internally in their implementation.'''
 
 import copy as _copy
 import sys as _sys
+from bisect import bisect_left as _bisect_left
 
 #===============================================================================
 # Linked elements
@@ -37,31 +38,49 @@ class Element:
     
     Elements do not define a __init__() method, hence it does not need to be
     called expliclty by subclasses.
+
+    Element itself defines empty __slots__: a non-empty __slots__ here would
+    prevent multiple inheritance with C-types such as str. The link to the
+    master list is stored in the _masterlist attribute, which lives in the
+    instance __dict__ of subclasses that do not define __slots__. Concrete
+    subclasses may instead define a '_masterlist' slot and drop the __dict__
+    entirely:
+
+    >>> class slotstr(str, Element):
+    ...     __slots__ = ['_masterlist']
+    >>> b = slotstr('b')
+    >>> b.insert_prev(slotstr('a')); b.get_siblings()
+    ['a', 'b']
+    >>> hasattr(b, '__dict__')
+    False
     '''
-    # TODO: reimplement the reference system to remove the _masterlist attribute
-    # so we can define __slots__ on subtypes
-    #
-    # If we had defined __slots__ = ('masterlist') here, it would be impossible
-    # to have multiple inheritance with C-types such as str, list, etc.
 
+    __slots__ = ()
     _masterlist = None
 
     def _set_masterlist(self, mlist):
-        mlist_old = self._masterlist
+        mlist_old = getattr(self, '_masterlist', None)
         if mlist_old is not None and mlist_old is not mlist:
             raise ValueError('%r already in a Masterlist' % self)
         else:
             self._masterlist = mlist
 
     def __getstate__(self):
-        state = dict(self.__dict__)
+        # The _masterlist link is never copied or pickled
+        state = dict(getattr(self, '__dict__', ()))
         state.pop('_masterlist', None)
-        return state
+        slots = {}
+        for name in _slot_names(type(self)):
+            if name != '_masterlist' and hasattr(self, name):
+                slots[name] = getattr(self, name)
+        if slots:
+            return (state or None, slots)
+        return state or None
 
     def unlink(self):
         '''Remove itself from list.'''
 
-        if self._masterlist is not None:
+        if getattr(self, '_masterlist', None) is not None:
             self._masterlist.pop(self.idx)
 
     def unlinked(self):
@@ -73,22 +92,17 @@ class Element:
     def copy_unlinked(self, deepcopy=True):
         '''Return a copy of itself'''
 
-        try:
-            ml = self.__dict__.pop('_masterlist', None)
-            if deepcopy:
-                cp = _copy.deepcopy(self)
-            else:
-                cp = _copy.copy(self)
-        finally:
-            self._masterlist = ml
-        return cp
+        if deepcopy:
+            return _copy.deepcopy(self)
+        else:
+            return _copy.copy(self)
 
     def replace_by(self, other):
-        '''Replace itself by the other object. 
-        
+        '''Replace itself by the other object.
+
         The object will be unlinked from the list.'''
 
-        if self._masterlist is not None:
+        if getattr(self, '_masterlist', None) is not None:
             self._masterlist[self.idx] = other
         else:
             raise ValueError('object is not linked')
@@ -96,26 +110,24 @@ class Element:
     def insert_next(self, obj):
         '''Insert obj in the lists of objects just after itself'''
 
-        if self._masterlist is not None:
+        if getattr(self, '_masterlist', None) is not None:
             self._masterlist.insert(self.idx + 1, obj)
         else:
-            self._masterlist = Masterlist([obj])
-            self._masterlist.insert(0, self)
+            Masterlist([self, obj])
 
     def insert_prev(self, obj):
         '''Insert the given object prior to itself'''
 
-        if self._masterlist is not None:
+        if getattr(self, '_masterlist', None) is not None:
             self._masterlist.insert(self.idx, obj)
         else:
-            self._masterlist = Masterlist([obj])
-            self._masterlist.append(self)
+            Masterlist([obj, self])
 
     def get_masterlist(self):
         '''Return the master list that controls the prev/next relationships for
         the object'''
 
-        return self._masterlist or Masterlist([self])
+        return getattr(self, '_masterlist', None) or Masterlist([self])
 
     #===========================================================================
     # Properties
@@ -152,7 +164,7 @@ class Element:
             return False
 
     def get_siblings(self):
-        return list(self._masterlist or [self])
+        return list(getattr(self, '_masterlist', None) or [self])
 
     def get_siblings_next(self):
         '''A list of all siblings after itself'''
@@ -186,6 +198,8 @@ class Element:
 class Container(Element):
     '''An element that have children'''
 
+    __slots__ = ['_masterlist', '_children']
+
     def __init__(self):
         self._children = Masterlist([], self)
 
@@ -198,7 +212,12 @@ class Container(Element):
         return True
 
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        if isinstance(state, tuple):
+            state, slots = state
+            for name, value in slots.items():
+                setattr(self, name, value)
+        if state:
+            self.__dict__.update(state)
         self.children.parent = self
 
 class Masterlist(list):
@@ -255,14 +274,63 @@ class Masterlist(list):
     >>> L2 = copy.deepcopy(L); L2
     ['P', 'R', 'E', 'S', 'LEY']
 
+    Several elements can be removed and inserted in a single operation
+    
+    >>> L.splice(1, 2, map(pnstr, 'AI'))
+    ['R', 'E']
+    >>> L.replace_with_many(L[-1], map(pnstr, 'NT')); L
+    ['P', 'A', 'I', 'S', 'N', 'T']
+    
+    Elements of a given type are found without scanning the whole list
+    
+    >>> class pnint(int, Element): pass
+    >>> L.append(pnint(42)); L.of_type(int), L.first_of_type(int)
+    ([42], 42)
+    >>> L.pop(); L.of_type(int), L.first_of_type(int)
+    42
+    ([], None)
+    
     We can clear a list to unlink all its elements
     
     >>> L.clear()
-    ['P', 'R', 'E', 'S', 'LEY']
+    ['P', 'A', 'I', 'S', 'N', 'T']
     >>> R.has_siblings
     False
+    
+    Implementation
+    --------------
+    
+    Each element receives an integer order key. Keys grow along the list, but
+    are not contiguous: _labels holds the keys of all elements in list order 
+    and _cache maps the id of each element to its key. The index of an element
+    is found by a binary search of its key in _labels. 
+    
+    Insertions take a key between the keys of their neighbors. When there is 
+    no room left, the whole list is relabeled. Removals simply drop the key. 
+    Hence no operation needs to patch the keys of the elements that follow the
+    modified position.
+    
+    Repeated insertions at the same position eventually use all the room
+    between two keys. The list is then relabeled and indices stay correct
+    
+    >>> L = Masterlist(map(pnstr, 'AZ'))
+    >>> items = [pnstr('x%s' % i) for i in range(40)]
+    >>> for x in items:
+    ...     L.insert(1, x)
+    >>> [x.idx for x in L] == list(range(42))
+    True
+    >>> L.index(items[0]), L.index(items[-1]), L[-1].prev is items[0]
+    (40, 1, True)
+    
+    The type index used by of_type() is built on its first call and then kept
+    up to date by all modifications. _types maps each class to a dictionary
+    with the ids and objects of all its (direct) instances in the list. Lists
+    that are never queried by type pay nothing for it.
     '''
-    __slots__ = ['parent', '_cache']
+    __slots__ = ['parent', '_cache', '_labels', '_types']
+
+    # Distance between the keys of consecutive elements after relabeling
+    GAP = 2 ** 32
 
     def __init__(self, data=None, parent=None):
         # Only accept parents of the correct type
@@ -273,6 +341,8 @@ class Masterlist(list):
         super(Masterlist, self).__init__([])
         self.parent = parent
         self._cache = {}
+        self._labels = []
+        self._types = None
         self.extend(data or [])
 
 
@@ -280,7 +350,12 @@ class Masterlist(list):
     if _sys.flags.debug:
         def _has_consistent_idx(self):
             correct = list(range(len(self)))
-            return correct == sorted(self._cache.values()) == [ x.idx for x in self ]
+            labels = self._labels
+            types = self._types
+            return (labels == sorted(set(labels)) == sorted(self._cache.values()) 
+                    and correct == [ x.idx for x in self ]
+                    and (types is None or
+                         sorted(self._cache) == sorted(k for v in types.values() for k in v)))
     else:
         def _has_consistent_idx(self):
             return True
@@ -291,6 +366,9 @@ class Masterlist(list):
     def __delitem__(self, idx):
         if isinstance(idx, int):
             self.pop(idx)
+        elif isinstance(idx, slice) and idx.step in (None, 1):
+            start, stop, _ = idx.indices(len(self))
+            self.splice(start, max(stop - start, 0), ())
         else:
             delidx = sorted((obj.idx for obj in self[idx]), reverse=True)
             for idx in delidx:
@@ -311,49 +389,55 @@ class Masterlist(list):
             raise TypeError('only Elements are accepted, got %s' % (type(value).__name__))
 
         value._set_masterlist(self)
-        cache[id(value)] = idx = current.idx
+        cache[id(value)] = cache.pop(id(current))
         super(Masterlist, self).__setitem__(idx, value)
-        del cache[id(current)]
+        if self._types is not None:
+            self._types_remove([current])
+            self._types_add([value])
 
         # invariant checks
         assert self._has_consistent_idx()
 
     def __copy__(self):
+        # Copies of the elements do not receive the _masterlist link (see
+        # Element.__getstate__)
         L_copies = []
         for x in self:
-            try:
-                del x._masterlist
-                cp = _copy.copy(x)
-                if cp is x:
-                    raise RuntimeError('improper __copy__ implementation: '
-                                       'object and its copy cannot share identity')
-                L_copies.append(cp)
-            finally:
-                x._masterlist = self
-
-        L = Masterlist.__new__(type(self))
-        L._cache = {}
-        L._parent = self._parent
+            cp = _copy.copy(x)
+            if cp is x:
+                raise RuntimeError('improper __copy__ implementation: '
+                                   'object and its copy cannot share identity')
+            L_copies.append(cp)
+
+        L = _new_masterlist(type(self))
+        L.parent = self.parent
         L.extend(L_copies)
         return L
 
     def __deepcopy__(self, memo):
-        L = Masterlist.__new__(type(self))
-        L._cache = {}
+        L = _new_masterlist(type(self))
         memo[id(self)] = L
 
         for x in self:
-            try:
-                del x._masterlist
-                cp = _copy.deepcopy(x, memo)
-                assert cp is not x, ('improper __deepcopy__ implementation: '
-                                     'object and its copy cannot share identity')
-                L.append(cp)
-            finally:
-                x._masterlist = self
+            cp = _copy.deepcopy(x, memo)
+            assert cp is not x, ('improper __deepcopy__ implementation: '
+                                 'object and its copy cannot share identity')
+            L.append(cp)
         L.parent = None
         return L
 
+    def __reduce_ex__(self, protocol):
+        # Elements are linked by append(), which requires an initialized
+        # _cache. The default list protocol would restore items before it.
+        dict_state = dict(getattr(self, '__dict__', ()))
+        dict_state.pop('_masterlist', None)
+        slots = {'parent': self.parent}
+        for name in _slot_names(type(self)):
+            if name not in _MASTERLIST_SLOTS and hasattr(self, name):
+                slots[name] = getattr(self, name)
+        state = (dict_state or None, slots)
+        return (_new_masterlist, (type(self),), state, iter(self))
+
     def __imul__(self, n):
         raise TypeError('arithmetical operations are not allowed')
 
@@ -373,8 +457,13 @@ class Masterlist(list):
             raise TypeError('only Elements are accepted, got %s' % (type(value).__name__))
 
         value._set_masterlist(self)
+        labels = self._labels
+        label = labels[-1] + self.GAP if labels else 0
         super(Masterlist, self).append(value)
-        cache[id(value)] = len(self) - 1
+        labels.append(label)
+        cache[id(value)] = label
+        if self._types is not None:
+            self._types_add([value])
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -382,8 +471,7 @@ class Masterlist(list):
     def extend(self, seq):
         '''L.extend(iterable) -- extend list by appending elements from the iterable'''
 
-        for obj in seq:
-            self.append(obj)
+        self.splice(len(self), 0, seq)
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -393,7 +481,7 @@ class Masterlist(list):
         Raises ValueError if the value is not present.'''
 
         try:
-            idx = self._cache[id(obj)]
+            idx = _bisect_left(self._labels, self._cache[id(obj)])
         except KeyError:
             raise ValueError('not in list: %r' % obj)
         if start is not None and idx > start:
@@ -412,11 +500,32 @@ class Masterlist(list):
         if not isinstance(value, Element):
             raise TypeError('only Elements are accepted, got %s' % (type(value).__name__))
 
+        # Normalize index as in list.insert()
+        N = len(self)
+        if idx < 0:
+            idx = max(N + idx, 0)
+        elif idx > N:
+            idx = N
+        if idx == N:
+            return self.append(value)
+
+        # Take a key between the neighbors, relabeling if necessary
+        labels = self._labels
+        if idx == 0:
+            label = labels[0] - self.GAP
+        else:
+            before, after = labels[idx - 1], labels[idx]
+            if after - before < 2:
+                self._relabel()
+                before, after = labels[idx - 1], labels[idx]
+            label = (before + after) // 2
+
         value._set_masterlist(self)
         super(Masterlist, self).insert(idx, value)
-        cache[id(value)] = idx
-        for i in range(idx + 1, len(self)):
-            cache[id(self[i])] += 1
+        labels.insert(idx, label)
+        cache[id(value)] = label
+        if self._types is not None:
+            self._types_add([value])
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -429,16 +538,14 @@ class Masterlist(list):
 
         if idx is None:
             obj = super(Masterlist, self).pop()
-            del cache[id(obj)]
+            self._labels.pop()
         else:
-            N = len(self)
             obj = super(Masterlist, self).pop(idx)
-            idx = (idx if idx >= 0 else (N + idx))
-            for i in range(idx, N - 1):
-                cache[id(self[i])] -= 1
-            del cache[id(obj)]
-
-        del obj._masterlist
+            self._labels.pop(idx)
+        del cache[id(obj)]
+        obj._masterlist = None
+        if self._types is not None:
+            self._types_remove([obj])
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -448,7 +555,7 @@ class Masterlist(list):
         '''L.remove(value) -- remove first occurrence of value.
         Raises ValueError if the value is not present.'''
 
-        del self[self._cache[id(value)]]
+        del self[self.index(value)]
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -456,10 +563,8 @@ class Masterlist(list):
     def reverse(self):
         '''L.reverse() -- reverse *IN PLACE*'''
 
-        cache = self._cache
         super(Masterlist, self).reverse()
-        for i, obj in enumerate(self):
-            cache[id(obj)] = i
+        self._relabel()
 
         # invariant checks
         assert self._has_consistent_idx()
@@ -467,25 +572,210 @@ class Masterlist(list):
     def sort(self, key=None, reverse=False):
         '''L.sort(key=None, reverse=False) -- stable sort *IN PLACE*;'''
 
-        cache = self._cache
         super(Masterlist, self).sort(key=key, reverse=reverse)
-        for i, obj in enumerate(self):
-            cache[id(obj)] = i
+        self._relabel()
+
+        # invariant checks
+        assert self._has_consistent_idx()
+
+    def splice(self, index, delete_count, new_elements):
+        '''L.splice(index, delete_count, new_elements) -> list -- remove 
+        delete_count elements starting at index and insert the new elements at
+        their place. Return a list with the removed elements.
+        
+        All changes are done in a single pass: this is much faster than 
+        removing and inserting elements one at a time.'''
+
+        cache = self._cache
+        N = len(self)
+        if index < 0:
+            index = max(N + index, 0)
+        index = min(index, N)
+        stop = min(index + max(delete_count, 0), N)
+        removed = list.__getitem__(self, slice(index, stop))
+        new = list(new_elements)
+
+        # Check all elements before changing the list
+        removed_ids = {id(obj) for obj in removed}
+        new_ids = set()
+        for obj in new:
+            if not isinstance(obj, Element):
+                raise TypeError('only Elements are accepted, got %s' % (type(obj).__name__))
+            key = id(obj)
+            if key in new_ids or (key in cache and key not in removed_ids):
+                raise ValueError('object already present in the list')
+            mlist = getattr(obj, '_masterlist', None)
+            if mlist is not None and mlist is not self:
+                raise ValueError('%r already in a Masterlist' % obj)
+            new_ids.add(key)
+
+        # Unlink removed elements
+        for obj in removed:
+            del cache[id(obj)]
+            obj._masterlist = None
+
+        # Link the new ones
+        for obj in new:
+            obj._masterlist = self
+        list.__setitem__(self, slice(index, stop), new)
+        if self._types is not None:
+            self._types_remove(removed)
+            self._types_add(new)
+
+        # Take keys from the gap between neighbors or relabel everything
+        labels = self._labels
+        del labels[index:stop]
+        count = len(new)
+        if count:
+            GAP = self.GAP
+            if not labels:
+                keys = range(0, count * GAP, GAP)
+            elif index == len(labels):
+                keys = range(labels[-1] + GAP, labels[-1] + (count + 1) * GAP, GAP)
+            elif index == 0:
+                keys = range(labels[0] - count * GAP, labels[0], GAP)
+            else:
+                lo = labels[index - 1]
+                step = (labels[index] - lo) // (count + 1)
+                keys = range(lo + step, lo + step * count + 1, step) if step else None
+            if keys is None:
+                labels[index:index] = [0] * count
+                self._relabel()
+            else:
+                # Labels and cache share the same int objects
+                keys = list(keys)
+                labels[index:index] = keys
+                cache.update(zip(map(id, new), keys))
 
         # invariant checks
         assert self._has_consistent_idx()
+        return removed
+
+    def replace_with_many(self, elem, elems):
+        '''L.replace_with_many(elem, elems) -- replace elem by all elements in
+        the sequence elems'''
+
+        self.splice(self.index(elem), 1, elems)
+
+    @classmethod
+    def _from_unlinked(cls, elements, parent=None):
+        '''Return a new list with the given elements skipping all checks. 
+        
+        Elements must be unique and must not belong to any other list. This 
+        is used to build the children of cloned elements.'''
+
+        new = _new_masterlist(cls)
+        new.parent = parent
+        list.extend(new, elements)
+        for obj in elements:
+            obj._masterlist = new
+        new._labels = labels = list(range(0, len(elements) * cls.GAP, cls.GAP))
+        new._cache = dict(zip(map(id, elements), labels))
+        new._types = None
+
+        # invariant checks
+        assert new._has_consistent_idx()
+        return new
+
+    def of_type(self, cls):
+        '''L.of_type(cls) -> list -- return all elements that are instances of
+        cls (a class or a tuple of classes) in list order'''
+
+        matches = self._type_matches(cls)
+        if len(matches) > 1:
+            cache = self._cache
+            matches.sort(key=lambda obj: cache[id(obj)])
+        return matches
+
+    def first_of_type(self, cls):
+        '''L.first_of_type(cls) -> element -- return the first instance of cls
+        in the list or None'''
+
+        matches = self._type_matches(cls)
+        if not matches:
+            return None
+        cache = self._cache
+        return min(matches, key=lambda obj: cache[id(obj)])
+
+    def types(self):
+        '''L.types() -> list -- return the classes of all elements in the list'''
+
+        if self._types is None:
+            self._type_matches(())
+        return list(self._types)
+
+    def _type_matches(self, cls):
+        types = self._types
+        if types is None:
+            types = self._types = {}
+            self._types_add(self)
+        matches = []
+        for tt, objs in types.items():
+            if issubclass(tt, cls):
+                matches.extend(objs.values())
+        return matches
+
+    def _types_add(self, objs):
+        types = self._types
+        for obj in objs:
+            try:
+                types[type(obj)][id(obj)] = obj
+            except KeyError:
+                types[type(obj)] = {id(obj): obj}
+
+    def _types_remove(self, objs):
+        types = self._types
+        for obj in objs:
+            tt = type(obj)
+            objs_tt = types[tt]
+            del objs_tt[id(obj)]
+            if not objs_tt:
+                del types[tt]
+
+    def _relabel(self):
+        '''Assign evenly spaced keys to all elements'''
+
+        labels = self._labels
+        labels[:] = range(0, len(self) * self.GAP, self.GAP)
+        self._cache.update(zip(map(id, self), labels))
 
     def clear(self):
         '''L.clear() -> list -- clear all objects in the list and return a list 
         of the cleared objects. This clear the next/prev association between 
         these objects.'''
 
-        objects = list(self)
-        del self[:]
-
-        # invariant checks
-        assert self._has_consistent_idx()
-        return objects
+        return self.splice(0, len(self), ())
+
+_MASTERLIST_SLOTS = {'_masterlist', 'parent', '_cache', '_labels', '_types'}
+_SLOT_NAMES = {}
+
+def _slot_names(cls):
+    '''Return a list with the names of all slots defined in cls and in its 
+    bases'''
+
+    try:
+        return _SLOT_NAMES[cls]
+    except KeyError:
+        pass
+
+    names = []
+    for base in cls.__mro__:
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = [slots]
+        names.extend(x for x in slots if x not in ('__dict__', '__weakref__'))
+    _SLOT_NAMES[cls] = names
+    return names
+
+def _new_masterlist(cls):
+    '''Return an empty instance of a Masterlist subclass. Used by pickle.'''
+
+    new = list.__new__(cls)
+    new._cache = {}
+    new._labels = []
+    new._types = None
+    new.parent = None
+    return new
 
 if __name__ == '__main__':
     import doctest
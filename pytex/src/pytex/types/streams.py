@@ -0,0 +1,181 @@
+'''String-like views of files that are loaded into memory in bounded chunks.'''
+
+import codecs
+from array import array
+from bisect import bisect_right
+
+class StreamSource:
+    r'''A read-only view of a file object or mmap that mimics the subset of the
+    str interface used by the Tokenizer.
+
+    Characters are accessed by their absolute position in the file. Data is 
+    read in chunks of `chunk_size` bytes/characters as needed and everything 
+    before the `keep` last characters that were accessed is discarded when a 
+    new chunk is loaded. This keeps memory usage flat for very large inputs.
+    Reading discarded data raises a ValueError.
+    
+    Binary files and mmaps are decoded incrementally with the given encoding.
+
+    Examples
+    --------
+
+    >>> import io
+    >>> src = StreamSource(io.BytesIO('olá mundo'.encode('utf8')), chunk_size=2)
+    >>> src[0], src[2], src[4:9], src.find('und', 1)
+    ('o', 'á', 'mundo', 5)
+    
+    The offsets of the beginning of each line are recorded as data is read.
+    Lines before the data in memory are forgotten: `first_line` is the number 
+    of the line that starts at line_starts[0]
+    
+    >>> list(StreamSource(io.StringIO('foo\nbar\n')).line_starts)
+    [0]
+    >>> lines = StreamSource(io.StringIO('foo\nbar\n')); lines.find('xx')
+    -1
+    >>> list(lines.line_starts)
+    [0, 4, 8]
+    >>> lines = StreamSource(io.StringIO('line\n' * 100), chunk_size=10, keep=10)
+    >>> lines[499], lines.first_line, len(lines.line_starts) < 10
+    ('\n', 96, True)
+    >>> lines[0:5]
+    Traceback (most recent call last):
+    ...
+    ValueError: source data before position 480 was discarded
+    
+    Positions after the end of file behave like in strings
+    
+    >>> src[7:20], src.find('foo')
+    ('do', -1)
+    >>> src[9]
+    Traceback (most recent call last):
+    ...
+    IndexError: source index out of range
+    '''
+
+    def __init__(self, file, encoding='utf8', chunk_size=2 ** 16, keep=1024):
+        self.chunk_size = chunk_size
+        self.keep = keep
+        self._file = file
+        self._data = ''
+        self._offset = 0
+        self._eof = False
+        self.line_starts = array('q', [0])
+        self.first_line = 0
+        if isinstance(file.read(0), bytes):
+            self._decoder = codecs.getincrementaldecoder(encoding)()
+        else:
+            self._decoder = None
+
+    def __repr__(self):
+        name = getattr(self._file, 'name', None) or type(self._file).__name__
+        return 'StreamSource(%r)' % name
+
+    def _fill(self, low):
+        '''Read a new chunk from file. Data before low - keep is discarded.
+        Return False at EOF.'''
+
+        if self._eof:
+            return False
+
+        # Discard old data
+        cut = min(low - self.keep - self._offset, len(self._data))
+        if cut >= self.chunk_size:
+            self._data = self._data[cut:]
+            self._offset += cut
+
+            # Keep only the lines that end in the data in memory
+            line_starts = self.line_starts
+            n = bisect_right(line_starts, self._offset) - 1
+            if n > 0:
+                del line_starts[:n]
+                self.first_line += n
+
+        raw = self._file.read(self.chunk_size)
+        if self._decoder is not None:
+            chunk = self._decoder.decode(raw, final=not raw)
+        else:
+            chunk = raw
+        if not raw:
+            self._eof = True
+
+        # Save the position of new lines
+        base = self._offset + len(self._data)
+        line_starts = self.line_starts
+        idx = chunk.find('\n')
+        while idx != -1:
+            line_starts.append(base + idx + 1)
+            idx = chunk.find('\n', idx + 1)
+
+        self._data += chunk
+        return bool(raw)
+
+    def _ensure(self, end, low):
+        '''Load data until position end (exclusive) is in memory'''
+
+        while end > self._offset + len(self._data) and not self._eof:
+            self._fill(low)
+
+    def _check(self, pos):
+        if pos < self._offset:
+            raise ValueError('source data before position %s was discarded' % self._offset)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start = idx.start or 0
+            stop = idx.stop
+            self._check(start)
+            if stop is None:
+                while self._fill(start):
+                    pass
+            else:
+                self._ensure(stop, start)
+                stop -= self._offset
+            return self._data[start - self._offset:stop]
+
+        self._check(idx)
+        self._ensure(idx + 1, idx)
+        try:
+            return self._data[idx - self._offset]
+        except IndexError:
+            raise IndexError('source index out of range')
+
+    def find(self, sub, start=0):
+        '''Return the lowest position where sub is found or -1'''
+
+        self._check(start)
+        pos = start
+        while True:
+            idx = self._data.find(sub, pos - self._offset)
+            if idx != -1:
+                return idx + self._offset
+            pos = max(start, self._offset + len(self._data) - len(sub) + 1)
+            if not self._fill(start):
+                return -1
+
+    def match_end(self, regex, pos):
+        '''Match the compiled regex at pos and return the end position of the
+        match. The match can span several chunks.'''
+
+        self._check(pos)
+        while True:
+            data = self._data
+            end = regex.match(data, pos - self._offset).end()
+            if end < len(data) or not self._fill(pos):
+                return end + self._offset
+
+    def count(self, sub, start=0, end=None):
+        '''Count occurrences of sub in the [start, end) range'''
+
+        self._check(start)
+        if end is None:
+            end = self._offset + len(self._data)
+        else:
+            self._ensure(end, start)
+        if sub == '\n':
+            starts = self.line_starts
+            return bisect_right(starts, end) - bisect_right(starts, start)
+        return self._data.count(sub, start - self._offset, end - self._offset)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -3,13 +3,17 @@ if __name__ == '__main__':
 
 import traceback
 import sys
-from pygments import highlight
-from pygments.lexers import PythonLexer  # @UnresolvedImport
-from pygments.formatters import LatexFormatter  # @UnresolvedImport
 from .text import print_capture
 from .rawtex import tex_document
 
-PYGMENTS_DEFS = LatexFormatter().get_style_defs().strip()
+# Pygments is imported only when errors are rendered
+def __getattr__(name):
+    if name == 'PYGMENTS_DEFS':
+        from pygments.formatters import LatexFormatter  # @UnresolvedImport
+        global PYGMENTS_DEFS
+        PYGMENTS_DEFS = LatexFormatter().get_style_defs().strip()
+        return PYGMENTS_DEFS
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 def render_error(etype=None, evalue=None, tb=None, as_document=False):
     r'''Renders the last traceback as LaTeX code. The resulting code uses 
@@ -29,6 +33,10 @@ def render_error(etype=None, evalue=None, tb=None, as_document=False):
     \end{Verbatim}
     '''
 
+    from pygments import highlight
+    from pygments.lexers import PythonLexer  # @UnresolvedImport
+    from pygments.formatters import LatexFormatter  # @UnresolvedImport
+
     if evalue is None:
         etype, evalue, tb = sys.exc_info()
 
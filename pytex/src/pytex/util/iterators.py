@@ -1,4 +1,4 @@
-__all__ = ['bufferediter', 'walk_items', 'iter_items']
+__all__ = ['bufferediter', 'walk_items', 'find_first', 'iter_items']
 
 class bufferediter:
     """Buffered iterator. Items can be pushed to the main iteration."""
@@ -32,6 +32,10 @@ class bufferediter:
 # The walk_* functions iterate over all children and the children's children
 # recursivelly. iter_* functions do not use recursion
 #
+# Elements may declare a `subitem_types` tuple with the types of all objects
+# that can appear anywhere below them. walk_items() skips the subtrees that
+# cannot contain the searched type.
+#
 
 def _normalize_type(obj, name):
     '''Convert a latex name into the corresponding type (e.g. "\par" is 
@@ -53,20 +57,94 @@ def _normalize_type(obj, name):
         raise ValueError('unrecognized type: %s' % name)
 
 def walk_items(obj, item_type=None, **filters):
-    '''Like iter_items(), but works recursivelly in the children of each 
-    children'''
+    r'''Like iter_items(), but works recursivelly in the children of each 
+    children.
+
+    Items are visited in depth-first order, each item before its children.
+    The tree is walked with an explicit stack of iterators, so the cost of
+    yielding an item does not depend on its depth.
+
+    >>> from pytex import TeXJob
+    >>> from pytex.textypes import Macro, TeXString
+    >>> doc = TeXJob(r'\textbf{foo} \begin{verbatim}\textit{bar}\end{verbatim}'
+    ...              r' \emph{baz}').parse()
+    >>> list(walk_items(doc, Macro))
+    [<\textbf{foo} macro>, <\emph macro>]
+
+    The verbatim environment declares that it only contains strings, so its
+    subtree is skipped when searching for macros
+
+    >>> verbatim = type(doc.children[2])
+    >>> _subitems_method(verbatim, Macro) is None
+    True
+    >>> list(walk_items(doc, TeXString))
+    ['foo', ' ', '\\textit{bar}', ' ', 'baz']
+    '''
+
     item_type = _normalize_type(obj, item_type or object)
+    return _walk(obj, item_type, list(filters.items()))
+
+def find_first(obj, item_type=None, **filters):
+    r'''Return the first item yielded by walk_items() with the same arguments,
+    or None if no item matches. The walk stops at the first match.
+
+    >>> from pytex import TeXJob
+    >>> from pytex.textypes import Macro, Text
+    >>> doc = TeXJob(r'\textbf{foo} \emph{bar}').parse()
+    >>> find_first(doc, Text), find_first(doc, Macro, macro_name='emph')
+    ('foo', <\emph macro>)
+    >>> print(find_first(doc, Macro, macro_name='textit'))
+    None
+    '''
+
+    for item in walk_items(obj, item_type, **filters):
+        return item
+    return None
 
-    if isinstance(obj, item_type):
-        for (k, v) in filters.items():
-            if getattr(obj, k) != v:
+def _walk(obj, item_type, filters):
+    stack = []
+    push, pop = stack.append, stack.pop
+    descend = {}
+    end = object()
+
+    while True:
+        if isinstance(obj, item_type):
+            for (k, v) in filters:
+                if getattr(obj, k) != v:
+                    break
+            else:
+                yield obj
+
+        # Visit children unless the subtree cannot contain item_type
+        cls = type(obj)
+        try:
+            subitems = descend[cls]
+        except KeyError:
+            subitems = descend[cls] = _subitems_method(cls, item_type)
+        if subitems is not None:
+            push(subitems(obj))
+
+        # Take the next item from the innermost iterator that is not exhausted
+        while stack:
+            obj = next(stack[-1], end)
+            if obj is not end:
                 break
+            pop()
         else:
-            yield obj
+            return
 
-    if hasattr(obj, '_subitems_'):
-        for item in obj._subitems_():
-            yield from walk_items(item, item_type, **filters)
+def _subitems_method(cls, item_type):
+    '''Return the _subitems_ method of cls or None if instances of cls do 
+    not have subitems of the given type'''
+
+    subitems = getattr(cls, '_subitems_', None)
+    types = getattr(cls, 'subitem_types', None)
+    if subitems is None or types is None or item_type is object:
+        return subitems
+    for tt in types:
+        if issubclass(tt, item_type) or issubclass(item_type, tt):
+            return subitems
+    return None
 
 def iter_items(obj, item_type=None, **kwds):
     '''Iterate over all items of the given type amongst the children.
@@ -91,3 +169,7 @@ def iter_items(obj, item_type=None, **kwds):
                     break
             else:
                 yield item
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -1,4 +1,4 @@
-from fractions import gcd as _gcd
+from math import gcd as _gcd
 from functools import reduce
 
 __all__ = ['gcd', 'lcm']
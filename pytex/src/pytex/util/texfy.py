@@ -1,5 +1,5 @@
+import sys
 from multidispatch import multifunction
-import sympy as sp
 from .text import escape_tex
 from .. import textypes
 from ..textypes import TeXElement
@@ -35,6 +35,12 @@ def TeXfy(obj):
 
 @multifunction(None)
 def texfy_other(x):
+    # Sympy is slow to import. Objects can only be sympy expressions if sympy
+    # was already imported by someone else.
+    sp = sys.modules.get('sympy')
+    if sp is not None and isinstance(x, sp.Expr):
+        return textypes.TeXString(sp.latex(x))
+
     data = escape_tex(str(x))
     return textypes.Text(data)
 
@@ -42,7 +48,3 @@ def texfy_other(x):
 def from_int(x):
     return textypes.Integer(x)
 
-@texfy_other.dispatch(sp.Expr)
-def from_sp(x):
-    return textypes.TeXString(sp.latex(x))
-
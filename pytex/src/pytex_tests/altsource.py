@@ -38,6 +38,10 @@ def test_alt_cmd():
 def test_alt_cmd_cmd():
     eq_(alt(r'\alt{a|\b{\c{d}}}'), ('a', '\\b{\\c{d}}'))
 
+def test_alt_cmd_options():
+    # Each option is kept as a single Join when the document is revalued
+    eq_(alt(r'\alt{\b{x}|\c{y}z|w}'), ('\\b{x}', '\\c{y}z', 'w'))
+
 def test_alt_alt_cmd():
     eq_(alt(r'\alt{a|\alt{b}}'), ('a', 'b'))
 
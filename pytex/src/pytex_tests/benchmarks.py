@@ -0,0 +1,497 @@
+'''
+Performance benchmarks for pytex.
+
+These are not unit tests: each bench_* function runs a workload on a large
+document built from the files in the examples/ folder and returns a dictionary
+with its measurements. Run all benchmarks with
+
+    $ python -m pytex_tests.benchmarks
+'''
+if __name__ == '__main__':
+    import pytex_tests; __package__ = 'pytex_tests'  # @UnusedImport @ReservedAssignment
+
+import gc
+import os
+import sys
+import time
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from pytex import tokens as tk
+from pytex.util.iterators import walk_items
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), 'examples')
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pygments', 'sympy', 'numpy', 'ply', 'concurrent.futures',
+                 'multiprocessing']
+
+#===============================================================================
+# Utility functions
+#===============================================================================
+def example_bodies():
+    '''Return a list with the contents of \\begin{document}...\\end{document}
+    for all examples'''
+
+    bodies = []
+    for fname in sorted(os.listdir(EXAMPLES_DIR)):
+        if fname.endswith('.tex'):
+            with open(os.path.join(EXAMPLES_DIR, fname)) as F:
+                tex = F.read()
+            _, _, body = tex.partition('\\begin{document}')
+            body, _, _ = body.partition('\\end{document}')
+            bodies.append(body)
+    return bodies
+
+def large_document(scale=100):
+    '''Return a LaTeX document whose body is all example bodies repeated
+    `scale` times'''
+
+    body = ''.join(example_bodies()) * scale
+    return '\\documentclass{article}\n\\begin{document}%s\\end{document}\n' % body
+
+@contextmanager
+def gc_counter():
+    '''Count the number of garbage collections inside a with block. Yields
+    a dictionary that is updated with the number of collections at exit'''
+
+    result = {'collections': 0}
+
+    def callback(phase, info):
+        if phase == 'start':
+            result['collections'] += 1
+
+    gc.callbacks.append(callback)
+    try:
+        yield result
+    finally:
+        gc.callbacks.remove(callback)
+
+def measure(func, *args, trace_memory=True, **kwds):
+    '''Run func(*args, **kwds) and return a dictionary with the elapsed time,
+    peak memory and number of garbage collections.
+
+    Memory tracing slows down deeply recursive code considerably. Use
+    trace_memory=False to obtain reliable timings in these cases.'''
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    with gc_counter() as info:
+        t0 = time.perf_counter()
+        func(*args, **kwds)
+        info['time'] = time.perf_counter() - t0
+    if trace_memory:
+        info['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return info
+
+def import_time(module, repeat=3):
+    '''Import module in `repeat` fresh interpreters. Return the best import
+    time and the list of HEAVY_MODULES that were loaded by the import.
+    Raises ImportError if the module cannot be imported.'''
+
+    code = ('import sys, time\n'
+            't0 = time.perf_counter()\n'
+            'import %s\n'
+            'print(time.perf_counter() - t0)\n'
+            'print(*[m for m in %r if m in sys.modules])' % (module, HEAVY_MODULES))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, env.get('PYTHONPATH')]))
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', code], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode:
+            msg = 'cannot import %s:\n%s' % (module, proc.stderr.decode('utf8'))
+            raise ImportError(msg.rstrip())
+        elapsed, _, loaded = proc.stdout.decode('utf8').partition('\n')
+        times.append(float(elapsed))
+    return min(times), loaded.split()
+
+def report(title, results):
+    '''Print a table with the results of a benchmark'''
+
+    print(title)
+    print('-' * len(title))
+    for name, info in results.items():
+        data = ', '.join('%s=%.4g' % item for item in sorted(info.items()))
+        print('  %-20s %s' % (name, data))
+    print()
+
+#===============================================================================
+# Benchmarks
+#===============================================================================
+def bench_parse(scale=100):
+    '''Parse the examples scaled up `scale` times and report the parse
+    throughput in kB/s and elements/s'''
+
+    from pytex import TeXJob
+
+    source = large_document(scale)
+    n_elements = sum(1 for _ in walk_items(TeXJob(source).parse()))
+    info = measure(lambda: TeXJob(source).parse(), trace_memory=False)
+    info['kB/s'] = len(source) / info['time'] / 1024
+    info['elements/s'] = n_elements / info['time']
+    return {'scale=%s' % scale: info}
+
+def bench_token_cache(scale=200):
+    '''Tokenize a large document keeping all tokens in memory, with and
+    without the flyweight cache of single character tokens'''
+
+    source = large_document(scale)
+    results = {}
+    for name, cache in [('fresh tokens', None), ('token cache', tk.TokenCache())]:
+        results[name] = measure(lambda: list(tk.Tokenizer(source, token_cache=cache)))
+    return results
+
+def bench_import(modules=('pytex', 'pytex.util.errors', 'alttex')):
+    '''Measure the cold import time of the given modules'''
+
+    results = {}
+    for module in modules:
+        elapsed, loaded = import_time(module)
+        results[module] = {'time': elapsed, 'heavy modules': len(loaded)}
+    return results
+
+def bench_iter_events(scale=100):
+    '''Compare the peak memory of building the document tree with parse()
+    and of scanning it with iter_events()'''
+
+    from pytex import TeXJob
+
+    source = large_document(scale)
+    consume = lambda: sum(1 for _ in TeXJob(source).iter_events())
+    return {
+        'parse': measure(lambda: TeXJob(source).parse()),
+        'iter_events': measure(consume),
+    }
+
+def bench_tree_memory(scale=100):
+    '''Measure the memory retained by a parsed document and the average cost
+    of each element in its tree'''
+
+    from pytex import TeXJob
+
+    source = large_document(scale)
+    gc.collect()
+    tracemalloc.start()
+    doc = TeXJob(source).parse()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    elements = list(walk_items(doc))
+    return {'scale=%s' % scale: {
+        'retained_mb': retained / 2 ** 20,
+        'bytes/element': retained / len(elements),
+        'with __dict__': sum(1 for x in elements if hasattr(x, '__dict__')),
+    }}
+
+def bench_many(copies=50, workers=None):
+    '''Parse many small documents (all examples repeated `copies` times)
+    sequentially and with TeX_many()'''
+
+    from pytex import TeXJob, TeX_many
+
+    sources = [
+        '\\documentclass{article}\n\\begin{document}%s\\end{document}\n' % body
+        for body in example_bodies()
+    ] * copies
+    consume = lambda docs: sum(1 for _ in docs)
+    return {
+        'sequential': measure(lambda: consume(TeXJob(src).parse() for src in sources),
+                              trace_memory=False),
+        'TeX_many': measure(lambda: consume(TeX_many(sources, workers=workers)),
+                            trace_memory=False),
+    }
+
+def bench_nested_groups(depths=(100, 200, 400)):
+    '''Parse documents with deeply nested groups. Time should grow linearly
+    with depth'''
+
+    import sys
+    from pytex import TeXJob
+
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 50 * max(depths)))
+    try:
+        results = {}
+        for depth in depths:
+            source = '{a b ' * depth + 'x' + ' c}' * depth
+            results['depth=%s' % depth] = measure(lambda: TeXJob(source).parse(),
+                                                  trace_memory=False)
+        return results
+    finally:
+        sys.setrecursionlimit(limit)
+
+def bench_walk(depths=(100, 400, 1600), scale=100):
+    '''Walk documents with deeply nested groups and a large document. Time
+    should grow linearly with the number of elements, regardless of depth'''
+
+    from pytex import TeXJob
+    from pytex.textypes import Group
+    from pytex.util.iterators import find_first
+
+    # The parser still needs a high recursion limit for deep trees
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 50 * max(depths)))
+    try:
+        docs = {depth: TeXJob('{a b ' * depth + 'x' + ' c}' * depth).parse()
+                for depth in depths}
+    finally:
+        sys.setrecursionlimit(limit)
+
+    consume = lambda *args: sum(1 for _ in walk_items(*args))
+    results = {}
+    for depth, deep in docs.items():
+        results['depth=%s' % depth] = measure(consume, deep, trace_memory=False)
+    doc = TeXJob(large_document(scale)).parse()
+    results['scale=%s' % scale] = measure(consume, doc, trace_memory=False)
+    results['find_first'] = measure(find_first, doc, Group, trace_memory=False)
+    return results
+
+def bench_select(scale=100, names=('int', 'frac', 'par', 'alt')):
+    '''Find the macros with the given names in a large document with one
+    walk_items() loop for each name and with a single select_many() pass'''
+
+    from pytex import TeXJob
+    from pytex.textypes import Macro, select_many
+
+    doc = TeXJob(large_document(scale)).parse()
+    walk = lambda: [list(walk_items(doc, Macro, macro_name=name)) for name in names]
+    select = lambda: select_many(doc, names)
+    assert walk() == select()
+    return {
+        'walk_items': measure(walk, trace_memory=False),
+        'select_many': measure(select, trace_memory=False),
+        'anchored': measure(doc.select, '> * > par', trace_memory=False),
+    }
+
+def bench_context(n=1000):
+    '''Create `n` contexts rebuilding the base macro table each time (as all
+    contexts did before it was shared) and reusing the shared table'''
+
+    from pytex import Context
+
+    def rebuild():
+        for _ in range(n):
+            Context.BASE_TABLES.clear()
+            Context()
+
+    def shared():
+        for _ in range(n):
+            Context()
+
+    return {
+        'rebuild table': measure(rebuild, trace_memory=False),
+        'shared table': measure(shared, trace_memory=False),
+    }
+
+def bench_masterlist(sizes=(2000, 8000)):
+    '''Unlink every other element of a Masterlist, insert a new element after
+    each remaining one and look up idx/next/prev. Time should grow linearly
+    with size'''
+
+    from pytex.types.prevnext import Masterlist, Element
+
+    class Item(Element):
+        pass
+
+    def edit(L):
+        for x in list(L)[::2]:
+            x.unlink()
+        for x in list(L):
+            x.insert_next(Item())
+        for x in L:
+            x.idx, x.next, x.prev
+
+    results = {}
+    for size in sizes:
+        L = Masterlist([Item() for _ in range(size)])
+        results['size=%s' % size] = measure(edit, L, trace_memory=False)
+    return results
+
+def bench_splice(size=10000):
+    '''Insert a list of `size` elements at the start of a container and
+    rewrite a body with `size` children that revalue to Join objects'''
+
+    from pytex.textypes import Group, Join, Text
+
+    class Doubled(Text):
+        def revalue_double(self):
+            return Join([Text(self), Text(self)])
+
+    def add():
+        group = Group('{', [Text('x') for _ in range(size)], '}')
+        group.add([Text('y') for _ in range(size)], 0)
+
+    group = Group('{', [Doubled('x') for _ in range(size)], '}')
+    return {
+        'add list': measure(add, trace_memory=False),
+        'revalue joins': measure(group.revalue, 'double', trace_memory=False),
+    }
+
+def bench_type_lookup(scale=100, lookups=1000):
+    '''Look up the children of a given type in the body of a large document
+    scanning all children and with the type index of TeXContainer'''
+
+    from collections import Counter
+    from pytex import TeXJob
+    from pytex.textypes import Macro
+
+    # Look up the least common macro type
+    body = TeXJob(large_document(scale)).parse().get(1)
+    counts = Counter(type(x) for x in body if isinstance(x, Macro))
+    tt = min(counts, key=counts.get)
+
+    def scan():
+        for _ in range(lookups):
+            [x for x in body if isinstance(x, tt)]
+
+    def index():
+        for _ in range(lookups):
+            body.get_all(tt)
+
+    results = {
+        'scan': measure(scan, trace_memory=False),
+        'type index': measure(index, trace_memory=False),
+    }
+    results['type index']['children'] = len(body)
+    results['type index']['matches'] = len(body.get_all(tt))
+    return results
+
+def bench_clone(scale=100):
+    '''Copy a large parsed document with the clone protocol used by 
+    TeXElement.copy() and with copy.deepcopy()'''
+
+    import copy
+    from pytex import TeXJob
+
+    doc = TeXJob(large_document(scale)).parse()
+    return {
+        'copy': measure(doc.copy, trace_memory=False),
+        'deepcopy': measure(copy.deepcopy, doc, trace_memory=False),
+    }
+
+def bench_persistent(versions=50, scale=20):
+    '''Build many versions of a large document in which every 50th text
+    element changes, as copies of the mutable tree and as persistent trees
+    that share unchanged subtrees. Reports the memory retained by all versions'''
+
+    from pytex import TeXJob
+    from pytex.textypes import Text, freeze
+
+    class Version(Text):
+        __slots__ = []
+
+        def revalue_version(self, idx):
+            return Text('%s-%s' % (self, idx))
+
+    doc = TeXJob(large_document(scale)).parse()
+    texts = [x for x in walk_items(doc) if type(x) is Text and x.parent is not None]
+    for x in texts[::50]:
+        x.replace_by(Version(x))
+    frozen = freeze(doc)
+
+    def retained(func):
+        info = measure(func, trace_memory=False)
+        gc.collect()
+        tracemalloc.start()
+        data = func()
+        gc.collect()
+        info['retained_mb'] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        del data
+        return info
+
+    assert (frozen.revalue('version', 0).source() ==
+            doc.copy().revalue('version', 0).source())
+    return {
+        'copies': retained(lambda: [doc.copy().revalue('version', i)
+                                    for i in range(versions)]),
+        'persistent': retained(lambda: [frozen.revalue('version', i)
+                                        for i in range(versions)]),
+    }
+
+def bench_nested_environments(depth=20, copies=200, lookups=10 ** 6):
+    '''Parse documents with environments nested `depth` levels deep and time
+    raw macro table lookups with `depth` levels'''
+
+    from pytex import TeXJob
+    from pytex.types.nested_dict import NestedDict
+
+    body = '\\begin{center}\\textbf{foo} bar ' * depth + '\\emph{x}' + '\\end{center}' * depth
+    source = '\\documentclass{article}\n\\begin{document}%s\\end{document}\n' % (body * copies)
+    table = NestedDict({'macro%s' % i: i for i in range(500)})
+    for i in range(depth):
+        table.up()
+        table['local%s' % i] = i
+    keys = ['macro%s' % (i % 500) for i in range(lookups)]
+
+    def lookup():
+        for key in keys:
+            table[key]
+
+    def up_down():
+        for _ in range(lookups // depth):
+            for i in range(depth):
+                table.up()
+                table['local'] = i
+            for _ in range(depth):
+                table.down()
+
+    return {
+        'parse': measure(lambda: TeXJob(source).parse(), trace_memory=False),
+        'lookup': measure(lookup, trace_memory=False),
+        'up/down': measure(up_down, trace_memory=False),
+    }
+
+def bench_stream_cache(scale=100):
+    '''Parse a large document without a token stream cache, with an empty
+    cache and with a cache that already holds its tokens'''
+
+    import tempfile
+    from pytex import TeXJob
+    from pytex.cache import TokenStreamCache
+
+    source = large_document(scale)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TokenStreamCache(directory)
+        parse = lambda **kwds: TeXJob(source, **kwds).parse()
+        return {
+            'no cache': measure(parse, trace_memory=False),
+            'cache miss': measure(parse, stream_cache=cache, trace_memory=False),
+            'cache hit': measure(parse, stream_cache=cache, trace_memory=False),
+        }
+
+def bench_parse_cache(scale=100):
+    '''Parse a large document without a parse cache and with cache hits in
+    memory and on disk'''
+
+    import tempfile
+    from pytex import TeXJob
+    from pytex.cache import ParseCache
+
+    source = large_document(scale)
+    with tempfile.TemporaryDirectory() as directory:
+        ParseCache(directory).parse(source)
+        memory, disk = ParseCache(directory), ParseCache(directory)
+        memory.parse(source)
+        results = {
+            'no cache': measure(lambda: TeXJob(source).parse(), trace_memory=False),
+            'memory hit': measure(memory.parse, source, trace_memory=False),
+            'disk hit': measure(disk.parse, source, trace_memory=False),
+        }
+        results['disk hit']['hit_ratio'] = disk.stats()['hit_ratio']
+        return results
+
+#===============================================================================
+# Run benchmarks
+#===============================================================================
+def main():
+    for name, func in sorted(globals().items()):
+        if name.startswith('bench_') and callable(func):
+            report(name, func())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+'''
+Test that importing pytex and alttex is fast. Heavy dependencies (pygments, 
+sympy, numpy, ply, ...) must be loaded only by the features that need them.
+'''
+if __name__ == '__main__':
+    import pytex_tests; __package__ = 'pytex_tests'  # @UnusedImport @ReservedAssignment
+
+from .benchmarks import import_time
+
+# Maximum cold import times, in seconds
+IMPORT_BUDGET = {
+    'pytex': 0.25,
+    'alttex': 0.25,
+}
+
+def check_import(module):
+    elapsed, loaded = import_time(module)
+    assert not loaded, 'importing %s loads %s' % (module, ', '.join(loaded))
+    budget = IMPORT_BUDGET[module]
+    assert elapsed < budget, \
+        'importing %s took %.3fs (budget: %ss)' % (module, elapsed, budget)
+
+def test_pytex_import():
+    check_import('pytex')
+
+def test_alttex_import():
+    check_import('alttex')
+
+if __name__ == '__main__':
+    test_pytex_import()
+    test_alttex_import()
@@ -1 +1,9 @@
-from .complexity import complexity
+# The complexity module loads sympy and numpy: import it on first use
+def __getattr__(name):
+    if name == 'complexity':
+        from .complexity import complexity
+
+        # Importing the submodule binds its name in the package: fix it
+        globals()['complexity'] = complexity
+        return complexity
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))